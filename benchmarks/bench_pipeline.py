@@ -0,0 +1,217 @@
+'''
+End-to-end P&L pipeline benchmark on synthetic books.
+
+A book of N positions (a call/put pair on its own underlying) is generated over M sessions
+with a given tick density, recorded as a replay dataset and served through ReplayProvider.
+Each position then goes through the same steps as Add Trade:
+
+    fetch    HisPnl.main through the replay feed (ticks, bars, daily or intraday marks)
+    store    store_marks into a scratch option_data database
+    load     load_marks back
+    compute  trades_from_marks + merge_trades
+    plot     plot_pnl on an offscreen figure
+
+Per stage the report gives total seconds, rows per second and per-position p50/p95 latency,
+plus the whole pipeline, the instrumented fetch/decode/aggregate split, the tracemalloc peak and
+the size of the merged trades table (typed, and as the untyped object frame it replaced).
+
+    python benchmarks/bench_pipeline.py --positions 20 --days 60 --ticks 2000 --resolution 5min
+    python benchmarks/bench_pipeline.py --out after.json --compare before.json
+'''
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# no watchdog or metrics files from a benchmark run
+os.environ.setdefault('PNL_WATCHDOG', '0')
+os.environ.setdefault('PNL_METRICS_LOG', os.devnull)
+
+from realPrice.feed import ReplayProvider, record
+from realPrice.HisPnl import main as his_main, get_symbol
+from tools.pnl_db import init_option_db, store_marks, load_marks
+from tools.pnl_tools import trades_from_marks, merge_trades
+from tools.trading_calendar import get_calendar
+from tools.instrument import get_metrics
+from tools.schema import memory_report
+
+STAGES = ['fetch', 'store', 'load', 'compute', 'plot']
+LAST_SESSION = '2024-09-20'
+
+
+def make_book(root, positions, days, ticks_per_day, seed=0):
+    '''
+    Record ticks for every leg and underlying plus daily bars, return the position list.
+    '''
+    rng = np.random.default_rng(seed)
+    sessions = get_calendar().sessions_in_range('2000-01-01', LAST_SESSION)[-days:]
+    session_starts = pd.to_datetime(sessions).values.astype('datetime64[ns]') + np.timedelta64(9 * 3600 + 30 * 60, 's')
+    book = []
+    for i in range(positions):
+        symbol = f"SYN{i}"
+        strike = 100.0
+        expiration = str(sessions[-1])
+        call, put = get_symbol(symbol, strike, expiration)
+
+        offsets = np.sort(rng.integers(1, 23400 * 10**9, size=(days, ticks_per_day)), axis=1)
+        stamps = (session_starts[:, None] + offsets.astype('timedelta64[ns]')).ravel()
+        walk = 100 + np.cumsum(rng.normal(0, 0.05, stamps.size))
+        for leg, sign in ((call, 1), (put, -1)):
+            last = np.maximum(5 + sign * (walk - 100) * 0.5, 0.05)
+            record(root, 'ticks', leg, pd.DataFrame({'Timestamp': stamps, 'Last': last.round(2),
+                                                     'Bid': (last - 0.05).round(2), 'Ask': (last + 0.05).round(2)}))
+        record(root, 'ticks', symbol, pd.DataFrame({'Timestamp': stamps, 'Last': walk.round(2),
+                                                    'Bid': (walk - 0.01).round(2), 'Ask': (walk + 0.01).round(2)}))
+        closes = walk.reshape(days, ticks_per_day)[:, -1]
+        record(root, 'bars', symbol, pd.DataFrame({'Date': pd.to_datetime(sessions), 'Open': closes, 'High': closes,
+                                                   'Low': closes, 'Close': closes, 'Volume': 1e6}))
+        book.append({'symbol': symbol, 'strike': strike, 'expiration': expiration,
+                     'trade_date': str(sessions[0]), 'stock_trade_price': float(walk[0])})
+    return book
+
+
+def run_book(book, provider, conn, resolution, figure, canvas):
+    from tools.pnl_plot import plot_pnl
+    latencies = {stage: [] for stage in STAGES}
+    rows = {stage: 0 for stage in STAGES}
+    trades = pd.DataFrame()
+
+    for position in book:
+        call, put = get_symbol(position['symbol'], position['strike'], position['expiration'])
+
+        start = time.perf_counter()
+        marks = his_main(position['trade_date'], position['expiration'], position['symbol'], position['strike'],
+                         position['expiration'], provider=provider, resolution=resolution)
+        fetched = time.perf_counter()
+        store_marks(conn, marks, resolution)
+        stored = time.perf_counter()
+        loaded_marks = load_marks(conn, call, put, position['trade_date'], position['expiration'], resolution)
+        loaded = time.perf_counter()
+        new_trades = trades_from_marks(loaded_marks, position['symbol'], position['strike'], position['expiration'],
+                                       position['stock_trade_price'], -5.0, 'sell', 10, 'sell', 10, resolution)
+        trades = merge_trades(trades, new_trades)
+        computed = time.perf_counter()
+        figure.clear()
+        plot_pnl(figure, canvas, new_trades, position['symbol'], resolution)
+        plotted = time.perf_counter()
+
+        for stage, (a, b) in zip(STAGES, [(start, fetched), (fetched, stored), (stored, loaded),
+                                          (loaded, computed), (computed, plotted)]):
+            latencies[stage].append(b - a)
+        rows['fetch'] += len(marks)
+        rows['store'] += len(marks)
+        rows['load'] += len(loaded_marks)
+        rows['compute'] += len(new_trades)
+        rows['plot'] += len(new_trades)
+    return latencies, rows, trades
+
+
+def summarize(latencies, rows):
+    report = {}
+    total = np.zeros(len(next(iter(latencies.values()))))
+    for stage in STAGES:
+        values = np.asarray(latencies[stage])
+        total += values
+        report[stage] = {
+            'seconds': round(float(values.sum()), 6),
+            'rows_per_s': round(rows[stage] / values.sum(), 1) if values.sum() else None,
+            'p50_ms': round(float(np.percentile(values, 50)) * 1000, 3),
+            'p95_ms': round(float(np.percentile(values, 95)) * 1000, 3),
+        }
+    report['pipeline'] = {
+        'seconds': round(float(total.sum()), 6),
+        'positions_per_s': round(len(total) / total.sum(), 2) if total.sum() else None,
+        'p50_ms': round(float(np.percentile(total, 50)) * 1000, 3),
+        'p95_ms': round(float(np.percentile(total, 95)) * 1000, 3),
+    }
+    return report
+
+
+def compare(report, baseline):
+    # relative change of every seconds figure, negative is faster
+    lines = []
+    for stage, current in report['stages'].items():
+        before = baseline.get('stages', {}).get(stage, {}).get('seconds')
+        if before:
+            change = (current['seconds'] - before) / before * 100
+            lines.append(f"{stage:>9}: {before:.3f}s -> {current['seconds']:.3f}s ({change:+.1f}%)")
+    before_peak = baseline.get('peak_memory_mb')
+    if before_peak and report.get('peak_memory_mb'):
+        lines.append(f"{'memory':>9}: {before_peak:.1f}MB -> {report['peak_memory_mb']:.1f}MB")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=10)
+    parser.add_argument('--days', type=int, default=60, help='sessions per position')
+    parser.add_argument('--ticks', type=int, default=1000, help='ticks per leg per session')
+    parser.add_argument('--resolution', default='1D')
+    parser.add_argument('--latency', type=float, default=0.0, help='replay latency per request, seconds')
+    parser.add_argument('--throughput', type=float, default=None, help='replay rows per second')
+    parser.add_argument('--no-memory', action='store_true', help='skip tracemalloc, it slows every stage')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    parser.add_argument('--compare', help='baseline JSON report to diff against')
+    args = parser.parse_args()
+
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    with tempfile.TemporaryDirectory() as scratch:
+        started = time.perf_counter()
+        book = make_book(os.path.join(scratch, 'replay'), args.positions, args.days, args.ticks, args.seed)
+        generated = time.perf_counter() - started
+
+        provider = ReplayProvider(os.path.join(scratch, 'replay'), latency=args.latency, throughput=args.throughput)
+        conn = sqlite3.connect(os.path.join(scratch, 'option_data.db'))
+        init_option_db(conn)
+        figure = Figure()
+        canvas = FigureCanvasAgg(figure)
+
+        if not args.no_memory:
+            tracemalloc.start()
+        latencies, rows, trades = run_book(book, provider, conn, args.resolution, figure, canvas)
+        peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+        tracemalloc.stop()
+        conn.close()
+
+    instrumented = get_metrics().snapshot()
+    book_memory = memory_report(trades)
+    report = {
+        'config': {'positions': args.positions, 'days': args.days, 'ticks_per_day': args.ticks,
+                   'resolution': args.resolution, 'latency': args.latency, 'throughput': args.throughput,
+                   'seed': args.seed, 'tracemalloc': not args.no_memory},
+        'environment': {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+                        'machine': platform.machine()},
+        'generate_seconds': round(generated, 3),
+        'ticks_served': provider.rows_served,
+        'stages': summarize(latencies, rows),
+        'instrumented': {name: stats['total_s'] for name, stats in instrumented['stages'].items()},
+        'peak_memory_mb': round(peak / 2**20, 2) if peak is not None else None,
+        'trades_memory': {'rows': len(trades), 'bytes': int(book_memory.loc['TOTAL', 'bytes']),
+                          'object_bytes': int(book_memory.loc['TOTAL', 'object_bytes'])},
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    if args.compare:
+        with open(args.compare) as f:
+            print(compare(report, json.load(f)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Risk engine benchmark on a synthetic book.
+
+Builds N positions over U underlyings, then times implied-vol solving, a spot-move revaluation
+with aggregation, and historical-style scenario revaluation (S random scenarios) single-threaded
+and on the worker pool. No network or database is touched.
+
+    python benchmarks/bench_risk.py --positions 1000 --scenarios 500
+    python benchmarks/bench_risk.py --out risk.json
+'''
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault('PNL_METRICS_LOG', os.devnull)
+
+from tools.greeks import RiskEngine, book_legs
+from tools.scenarios import Scenarios, revalue_scenarios, stress_scenarios, WORKERS
+from tools.schema import as_trades
+
+NOW = pd.Timestamp('2024-09-16 10:00')
+
+
+def make_trades(positions, underlyings, seed=0):
+    rng = np.random.default_rng(seed)
+    symbols = np.array([f"SYN{i}" for i in range(underlyings)])
+    return as_trades(pd.DataFrame({
+        'trade_date': NOW - pd.Timedelta(days=3),
+        'symbol': rng.choice(symbols, positions),
+        'strike': rng.uniform(80, 120, positions).round(),
+        'expiration': rng.choice(pd.to_datetime(['2024-10-18', '2024-11-15', '2024-12-20']), positions),
+        'stock_trade_price': 100.0,
+        'effective_delta': rng.normal(0, 1, positions).round(2),
+        'call_trade_price': 3.0,
+        'call_action_type': rng.choice(['buy', 'sell'], positions),
+        'num_call_contracts': rng.integers(0, 10, positions),
+        'put_trade_price': 3.0,
+        'put_action_type': rng.choice(['buy', 'sell'], positions),
+        'num_put_contracts': rng.integers(0, 10, positions),
+        'stock_close_price': 100.0,
+        'call_close_price': rng.uniform(1, 12, positions),
+        'put_close_price': rng.uniform(1, 12, positions),
+        'daily_pnl': 0.0,
+        'change': 0.0,
+        'resolution': '1D',
+    }))
+
+
+def timed_call(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--positions', type=int, default=1000)
+    parser.add_argument('--underlyings', type=int, default=20)
+    parser.add_argument('--scenarios', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the JSON report here')
+    args = parser.parse_args()
+
+    trades = make_trades(args.positions, args.underlyings, args.seed)
+    engine, build = timed_call(RiskEngine, book_legs(trades), now=NOW)
+    underlyings = list(engine.underlyings)
+
+    moves = {name: 101.0 for name in underlyings[:1]}
+    risk, revalue = timed_call(engine.revalue, moves)
+    _, aggregate = timed_call(engine.aggregate, risk)
+
+    rng = np.random.default_rng(args.seed + 1)
+    scenarios = Scenarios([f"s{i}" for i in range(args.scenarios)], underlyings,
+                          rng.normal(0, 0.02, (args.scenarios, len(underlyings))),
+                          rng.normal(0, 0.01, (args.scenarios, len(underlyings))))
+    # small blocks so the pool has work to share out
+    block = max(len(engine.quantity) * max(args.scenarios // (4 * WORKERS), 1), 1)
+    serial, serial_s = timed_call(revalue_scenarios, engine, scenarios, workers=1, block_cells=block)
+    pooled, pooled_s = timed_call(revalue_scenarios, engine, scenarios, block_cells=block)
+    stress, stress_s = timed_call(revalue_scenarios, engine, stress_scenarios(underlyings))
+    var, es = pooled.var(0.99)
+
+    report = {
+        'config': {'positions': args.positions, 'legs': len(engine.quantity), 'underlyings': len(underlyings),
+                   'scenarios': args.scenarios, 'workers': WORKERS, 'seed': args.seed},
+        'seconds': {'build_and_implied_vols': round(build, 4), 'revalue': round(revalue, 4),
+                    'aggregate': round(aggregate, 4), 'scenarios_serial': round(serial_s, 4),
+                    'scenarios_pool': round(pooled_s, 4), 'stress': round(stress_s, 4)},
+        'leg_revaluations_per_s': round(args.scenarios * len(engine.quantity) / pooled_s),
+        'var_99': round(var, 2),
+        'es_99': round(es, 2),
+        'worst_stress': {name: round(pnl, 2) for name, pnl in stress.worst(3)['pnl'].items()},
+        'pool_matches_serial': bool(np.allclose(serial.pnl, pooled.pnl)),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+
+
+if __name__ == '__main__':
+    main()
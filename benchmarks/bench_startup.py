@@ -0,0 +1,139 @@
+'''
+Cold-start benchmark for the desktop entry points.
+
+Every app is started in a fresh interpreter (so nothing is already imported) inside a
+scratch directory, and the child reports how long it took to import the module, to
+build and show the main window, and to finish the deferred plot setup.
+
+    python benchmarks/bench_startup.py                # all apps, JSON on stdout
+    python benchmarks/bench_startup.py pnl --runs 5 --imports --out startup.json
+
+The Qt platform defaults to offscreen; set QT_QPA_PLATFORM to measure a real display.
+Exits with status 1 when the median time to a shown window exceeds --budget seconds.
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APPS = {
+    'pnl': 'OptionPNLApp',
+    'pnl_index': 'OptionPNLApp',
+    'pnl_history': 'OptionPNLApp',
+    'blackScholes': 'OptionStrategyVisualizer',
+}
+
+
+def child(module_name, class_name):
+    start = time.perf_counter()
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication([])
+    qt_ready = time.perf_counter()
+
+    import importlib
+    module = importlib.import_module(module_name)
+    imported = time.perf_counter()
+
+    # the constructors call show(), the plot canvas follows from a zero-delay timer
+    window = getattr(module, class_name)()
+    shown = time.perf_counter()
+
+    deadline = shown + 30
+    app.processEvents()
+    while not hasattr(window, 'canvas') and hasattr(window, 'plot_placeholder') and time.perf_counter() < deadline:
+        app.processEvents()
+    ready = time.perf_counter()
+
+    print(json.dumps({
+        'qt': qt_ready - start,
+        'import': imported - qt_ready,
+        'window': shown - imported,
+        'to_window': shown - start,
+        'to_ready': ready - start,
+        'modules': len(sys.modules),
+    }))
+
+
+def top_imports(stderr, count):
+    # -X importtime lines: "import time: self | cumulative | name"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace('import time:', '|').split('|')]
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    # top-level packages only, their cumulative time already covers the submodules
+    rows = [row for row in rows if '.' not in row[2]]
+    return [{'module': name, 'cumulative_ms': cumulative / 1000, 'self_ms': own / 1000}
+            for cumulative, own, name in sorted(rows, reverse=True)[:count]]
+
+
+def run(module_name, class_name, imports=False):
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    command = [sys.executable]
+    if imports:
+        command += ['-X', 'importtime']
+    command += [os.path.abspath(__file__), '--child', module_name, class_name]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        started = time.perf_counter()
+        proc = subprocess.run(command, cwd=scratch, env=env, capture_output=True, text=True)
+        wall = time.perf_counter() - started
+    lines = [line for line in proc.stdout.splitlines() if line.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        error = proc.stderr.strip().splitlines()
+        return {'error': error[-1] if error else f'exit status {proc.returncode}'}
+    result = json.loads(lines[-1])
+    result['process'] = wall
+    if imports:
+        result['top_imports'] = top_imports(proc.stderr, 10)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('apps', nargs='*', default=list(APPS), help='entry points to start')
+    parser.add_argument('--runs', type=int, default=3, help='cold starts per app')
+    parser.add_argument('--imports', action='store_true', help='add the slowest imports of the last run')
+    parser.add_argument('--budget', type=float, default=1.0, help='seconds allowed until the window is shown')
+    parser.add_argument('--out', help='also write the JSON report to this file')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    report = {'python': sys.version.split()[0], 'budget': args.budget, 'apps': {}}
+    over_budget = False
+    for app in args.apps:
+        runs = [run(app, APPS[app], args.imports and i == args.runs - 1) for i in range(args.runs)]
+        ok = [r for r in runs if 'error' not in r]
+        if not ok:
+            report['apps'][app] = {'error': runs[-1]['error']}
+            continue
+        summary = {key: statistics.median([r[key] for r in ok]) for key in ('qt', 'import', 'window', 'to_window', 'to_ready', 'process')}
+        summary['modules'] = ok[-1]['modules']
+        summary['runs'] = len(ok)
+        if 'top_imports' in ok[-1]:
+            summary['top_imports'] = ok[-1]['top_imports']
+        over_budget |= summary['to_window'] > args.budget
+        report['apps'][app] = summary
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write(text)
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,12 @@
 import sys
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QSlider, QWidget, QVBoxLayout,
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QSlider, QWidget, QVBoxLayout, QCheckBox,
                              QHBoxLayout, QLabel, QLineEdit, QComboBox, QPushButton,
                              QGridLayout, QFrame, QSizePolicy, QDateEdit)
 from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QDate)
 from PyQt5.QtGui import QFont
 from datetime import date, datetime
-from scipy.stats import norm
 import numpy as np
 import pytz
-import holidays
 import logging
 
 from realPrice.realStock import get_realtime_stock_price
@@ -16,14 +14,21 @@ from realPrice.realOption import get_realtime_option_price, calls_or_puts
 from tools.stylesheet import stylesheet
 from tools.creations import create_input_field, create_date_field
 from tools.BsFetch import FetchStockThread, FetchOptionThread
+from tools.refresh_scheduler import RefreshScheduler
+from tools.watchdog import install_watchdog
 from black_scholes import BlackScholes  # Imported from the compiled C++ module
 
 class OptionStrategyVisualizer(QMainWindow):
     def __init__(self):
         super().__init__()
         self.bs_model = BlackScholes()  
+        self.refreshing = False
+        self.last_quotes = None
+        self.scheduler = RefreshScheduler(self)
+        self.scheduler.due.connect(self.fetch_data)
         self.initUI()
         self.setStyleSheet(stylesheet)
+        self.watchdog = install_watchdog(self)
 
     def initUI(self):
         self.setWindowTitle("Black-Scholes Option Pricing Model")
@@ -61,6 +66,8 @@ class OptionStrategyVisualizer(QMainWindow):
 
         self.fetch_data_button = QPushButton('Fetch Data / Refresh', control_panel)
         self.fetch_data_button.clicked.connect(self.fetch_data)
+        self.auto_refresh_input = QCheckBox('Auto Refresh', control_panel)
+        self.auto_refresh_input.toggled.connect(self.toggle_auto_refresh)
         
         input_layout_4 = QHBoxLayout()
         self.stock_price_input = create_input_field('SPrice', '210', False)
@@ -108,6 +115,7 @@ class OptionStrategyVisualizer(QMainWindow):
         control_layout.addLayout(input_layout_t)
         control_layout.addLayout(input_layout_2)
         control_layout.addWidget(self.fetch_data_button)
+        control_layout.addWidget(self.auto_refresh_input)
         control_layout.addLayout(input_layout_4)
         control_layout.addLayout(input_layout_5)
         control_layout.addLayout(input_layout_6)
@@ -118,19 +126,39 @@ class OptionStrategyVisualizer(QMainWindow):
         self.show()
         self.calculate_T_days(self.date_input.input_field.text())
   
+    def toggle_auto_refresh(self, checked):
+        if checked:
+            self.scheduler.start()
+        else:
+            self.scheduler.stop()
+
     def fetch_data(self):
-        company = self.symbol_input.input_field.text()
-        date = self.date_input.input_field.text()
+        # One refresh runs stock -> option chain -> recalculate, each step started when the previous one finished
+        if self.refreshing:
+            return
+        self.refreshing = True
+        self.fetch_stock_price(self.symbol_input.input_field.text())
+
+    def refresh_finished(self):
+        # the refresh is released and the next one scheduled even when the inputs do not parse
+        changed = False
+        try:
+            self.recalculate()
+            quotes = tuple(field.input_field.text() for field in (
+                self.stock_price_input, self.call_premium_input, self.put_premium_input,
+                self.call_ask_input, self.call_bid_input, self.put_ask_input, self.put_bid_input))
+            changed = quotes != self.last_quotes
+            self.last_quotes = quotes
+        finally:
+            self.refreshing = False
+            self.scheduler.done(changed)
+
+    def recalculate(self):
         strike = float(self.x_input.input_field.text())
         T = int(self.time_input.input_field.text())
 
-        self.fetch_stock_price(company)
-
         stock_price = self.stock_price_input.input_field.text()
-        if stock_price != 'NA':
-            stock_price = float(stock_price)
-
-        self.update_option_premiums()
+        stock_price = float(stock_price) if stock_price != 'NA' else None
 
         call_premium = None
         put_premium = None
@@ -204,11 +232,12 @@ class OptionStrategyVisualizer(QMainWindow):
 
     def fetch_stock_price(self, company):
         if hasattr(self, 'stock_fetch_thread'):
-            self.stock_fetch_thread.quit()
             self.stock_fetch_thread.wait()
 
         self.stock_fetch_thread = FetchStockThread(company)
         self.stock_fetch_thread.data_fetched.connect(self.update_stock_price_input)
+        # the chain is fetched once the quote is in, whether or not it arrived
+        self.stock_fetch_thread.finished.connect(self.update_option_premiums)
         self.stock_fetch_thread.start()
 
     def update_stock_price_input(self, price, price_change, percent_change):
@@ -232,16 +261,25 @@ class OptionStrategyVisualizer(QMainWindow):
         self.percent_change_input.input_field.setStyleSheet(f"color: {color};")
         
     def update_option_premiums(self):
-        company = self.symbol_input.input_field.text()
-        date = self.date_input.input_field.text()
-        strike = float(self.x_input.input_field.text())
-
-        if hasattr(self, 'option_fetch_thread'):
-            self.option_fetch_thread.terminate()
-
-        self.option_fetch_thread = FetchOptionThread(company, date, strike)
-        self.option_fetch_thread.data_fetched.connect(self.fill_premium_inputs)
-        self.option_fetch_thread.start()
+        started = False
+        try:
+            company = self.symbol_input.input_field.text()
+            date = self.date_input.input_field.text()
+            strike = float(self.x_input.input_field.text())
+
+            if hasattr(self, 'option_fetch_thread'):
+                self.option_fetch_thread.wait()
+
+            self.option_fetch_thread = FetchOptionThread(company, date, strike)
+            self.option_fetch_thread.data_fetched.connect(self.fill_premium_inputs)
+            self.option_fetch_thread.finished.connect(self.refresh_finished)
+            self.option_fetch_thread.start()
+            started = True
+        finally:
+            # without a fetch thread refresh_finished never runs, so the refresh ends here
+            if not started:
+                self.refreshing = False
+                self.scheduler.done(False)
 
     def fill_premium_inputs(self, prices, ask_prices, bid_prices):
         call_premium_str = str(prices[0]) if prices and prices[0] is not None else "NA"
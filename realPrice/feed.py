@@ -0,0 +1,257 @@
+import os
+import sys
+import time
+import threading
+from abc import ABC, abstractmethod
+import pandas as pd
+from datetime import datetime
+
+from tools.instrument import stage, count
+
+
+# Columns of the frames a provider returns, also those of an empty answer
+TICK_COLUMNS = ['Timestamp', 'Last', 'Bid', 'Ask']
+BAR_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class FeedProvider(ABC):
+    '''
+    Source of historical ticks and daily bars for the P&L apps.
+    get_ticks returns a DataFrame with Timestamp, Last, Bid, Ask columns and
+    get_bars returns one with Date, Open, High, Low, Close, Volume columns.
+    '''
+    @abstractmethod
+    def get_ticks(self, symbol, begin_date, end_date):
+        pass
+
+    @abstractmethod
+    def get_bars(self, symbol, begin_date, end_date):
+        pass
+
+
+class FeedError(RuntimeError):
+    # the live feed cannot be set up or a lookup failed; raised instead of exiting so callers can recover
+    pass
+
+
+def initialize_clr():
+    # Set environment variables for Mono, the install path can be overridden with MONO_LIB_PATH
+    mono_lib_path = os.environ.get("MONO_LIB_PATH", "/opt/homebrew/Cellar/mono/6.12.0.206/lib")
+    os.environ["DYLD_LIBRARY_PATH"] = f"{mono_lib_path}:{os.environ.get('DYLD_LIBRARY_PATH', '')}"
+    os.environ["LD_LIBRARY_PATH"] = f"{mono_lib_path}:{os.environ.get('LD_LIBRARY_PATH', '')}"
+
+    # Print the environment variables to ensure they are set correctly
+    print(f"Python executable: {sys.executable}")
+    print(f"DYLD_LIBRARY_PATH: {os.environ.get('DYLD_LIBRARY_PATH')}")
+    print(f"LD_LIBRARY_PATH: {os.environ.get('LD_LIBRARY_PATH')}")
+    print(f"sys.path: {sys.path}")
+
+    # Try importing clr
+    try:
+        import clr  # This import should work after installing pythonnet
+        clr.AddReference('System.Collections')
+        from System import DateTime, TimeSpan
+        print("pythonnet is installed and clr module is available.")
+    except ImportError as e:
+        raise FeedError("pythonnet is not installed or clr module is not available. Please install it using 'pip install pythonnet'.") from e
+
+    # Set the assembly path
+    assembly_path = os.environ.get("IQFEED_ASSEMBLY_PATH", f'{os.getenv("HOME")}/Dropbox/Kamaly/History/Feed')
+    sys.path.append(assembly_path)
+
+    # Try adding the IQFeed.CSharpApiClient reference
+    try:
+        clr.AddReference("IQFeed.CSharpApiClient")
+    except Exception as e:
+        raise FeedError(f"Failed to add reference to IQFeed.CSharpApiClient: {e}") from e
+    return clr
+
+def is_iqconnect_running():
+    import psutil
+    for proc in psutil.process_iter(attrs=['pid', 'name']):
+        if proc.info['name'] == 'IQConnect.exe':
+            return True
+    return False
+
+def connect_lookup_client():
+    from IQFeed.CSharpApiClient.Lookup import LookupClientFactory
+    try:
+        lookupClient = LookupClientFactory.CreateNew()
+        lookupClient.Connect()
+        return lookupClient
+    except Exception as e:
+        raise FeedError(f"Failed to create or connect LookupClient: {e}") from e
+
+def get_historical_ticks(lookupClient, option_symbol, begin_date, end_date):
+    from System import DateTime, TimeSpan
+    try:
+        ticks = lookupClient.Historical.GetHistoryTickTimeframe(
+            option_symbol,
+            DateTime(*begin_date.timetuple()[:6]),
+            DateTime(*end_date.timetuple()[:6]),
+            100000,
+            TimeSpan(9, 30, 0),
+            TimeSpan(16, 0, 0),
+        )
+        return ticks
+    except Exception as e:
+        raise FeedError(f"Failed to get historical tick data: {e}") from e
+
+def convert_timestamp(system_datetime):
+    datetime_str = system_datetime.ToString("yyyy-MM-dd HH:mm:ss")
+    return datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
+
+def process_ticks(ticks):
+    res = []
+    for tick in ticks:
+        res.append({
+            "Timestamp": convert_timestamp(tick.Timestamp),
+            "Last": tick.Last,
+            "Bid": tick.Bid,
+            "Ask": tick.Ask,
+        })
+    return res
+
+
+class LiveProvider(FeedProvider):
+    '''
+    Ticks from a running IQConnect.exe through pythonnet, daily bars from the local bar store (backed by yfinance).
+    The CLR and the lookup client are set up once, on the first tick request.
+    '''
+    def __init__(self):
+        self.lookup_client = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            if self.lookup_client is None:
+                initialize_clr()
+                if not is_iqconnect_running():
+                    raise FeedError("IQConnect is not running. Please start IQConnect manually before executing the script.")
+                self.lookup_client = connect_lookup_client()
+        return self.lookup_client
+
+    def get_ticks(self, symbol, begin_date, end_date):
+        with stage('fetch', f'iqfeed ticks {symbol}'):
+            ticks = get_historical_ticks(self.connect(), symbol, begin_date, end_date)
+        with stage('decode', f'iqfeed ticks {symbol}'):
+            df = pd.DataFrame(process_ticks(ticks), columns=TICK_COLUMNS)
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        count('ticks', len(df))
+        return df
+
+    def get_bars(self, symbol, begin_date, end_date):
+        from tools.price_store import get_bar_store
+        return get_bar_store().history(symbol, begin_date, end_date)
+
+
+class ReplayProvider(FeedProvider):
+    '''
+    Serves recorded datasets from a local directory in place of IQFeed.
+    Ticks are read from <root>/ticks/<symbol>.csv and bars from <root>/bars/<symbol>.csv.
+    Every request waits `latency` seconds, and `throughput` (rows per second)
+    throttles large responses the way a real lookup socket would.
+    '''
+    def __init__(self, root, latency=0.0, throughput=None):
+        self.root = root
+        self.latency = latency
+        self.throughput = throughput
+        self.datasets = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rows_served = 0
+
+    def load(self, kind, symbol):
+        key = (kind, symbol)
+        with self.lock:
+            if key not in self.datasets:
+                path = os.path.join(self.root, kind, f"{symbol}.csv")
+                time_col = 'Timestamp' if kind == 'ticks' else 'Date'
+                if not os.path.exists(path):
+                    print(f"No recorded {kind} for {symbol} in {self.root}.")
+                    # the columns callers select from, so a missing dataset reads as no rows
+                    df = pd.DataFrame({column: pd.Series(dtype='datetime64[ns]' if column == time_col else 'float64')
+                                       for column in (TICK_COLUMNS if kind == 'ticks' else BAR_COLUMNS)})
+                else:
+                    with stage('decode', f'replay {kind} {symbol}'):
+                        df = pd.read_csv(path, parse_dates=[time_col])
+                        df = df.sort_values(by=time_col, kind='stable').reset_index(drop=True)
+                self.datasets[key] = df
+            return self.datasets[key]
+
+    def serve(self, df, time_col, begin_date, end_date):
+        with stage('fetch', 'replay'):
+            return self.slice(df, time_col, begin_date, end_date)
+
+    def slice(self, df, time_col, begin_date, end_date):
+        if df.empty:
+            # a copy, callers add and rename columns on what they get
+            part = df.iloc[0:0].copy()
+        else:
+            times = df[time_col].values
+            lo = times.searchsorted(pd.Timestamp(begin_date).to_datetime64(), side='left')
+            hi = times.searchsorted(pd.Timestamp(end_date).to_datetime64(), side='right')
+            part = df.iloc[lo:hi].reset_index(drop=True)
+
+        delay = self.latency
+        if self.throughput:
+            delay += len(part) / self.throughput
+        if delay > 0:
+            time.sleep(delay)
+
+        with self.lock:
+            self.requests += 1
+            self.rows_served += len(part)
+        count('ticks' if time_col == 'Timestamp' else 'bars', len(part))
+        return part
+
+    def get_ticks(self, symbol, begin_date, end_date):
+        return self.serve(self.load('ticks', symbol), 'Timestamp', begin_date, end_date)
+
+    def get_bars(self, symbol, begin_date, end_date):
+        return self.serve(self.load('bars', symbol), 'Date', begin_date, end_date)
+
+
+def record(root, kind, symbol, df):
+    '''
+    Save a tick or bar DataFrame under root so a ReplayProvider can serve it.
+    '''
+    directory = os.path.join(root, kind)
+    os.makedirs(directory, exist_ok=True)
+    df.to_csv(os.path.join(directory, f"{symbol}.csv"), index=False)
+
+def record_from(provider, root, symbols, begin_date, end_date, kind='ticks'):
+    # Capture a live session into a replay dataset
+    for symbol in symbols:
+        if kind == 'ticks':
+            df = provider.get_ticks(symbol, begin_date, end_date)
+        else:
+            df = provider.get_bars(symbol, begin_date, end_date)
+        record(root, kind, symbol, df)
+        print(f"Recorded {len(df)} {kind} for {symbol}.")
+
+
+_provider = None
+
+def get_provider():
+    '''
+    Process-wide provider, picked from the environment on first use:
+    PNL_FEED=replay serves PNL_REPLAY_DIR with optional PNL_REPLAY_LATENCY
+    (seconds) and PNL_REPLAY_THROUGHPUT (rows per second); anything else is live.
+    '''
+    global _provider
+    if _provider is None:
+        if os.environ.get("PNL_FEED", "iqfeed").lower() == "replay":
+            throughput = os.environ.get("PNL_REPLAY_THROUGHPUT")
+            _provider = ReplayProvider(
+                os.environ.get("PNL_REPLAY_DIR", "replay"),
+                latency=float(os.environ.get("PNL_REPLAY_LATENCY", "0")),
+                throughput=float(throughput) if throughput else None,
+            )
+        else:
+            _provider = LiveProvider()
+    return _provider
+
+def set_provider(provider):
+    global _provider
+    _provider = provider
@@ -1,56 +1,50 @@
-import yfinance as yf
+from tools.chain_cache import get_chain_cache
+from tools.symbology import parse_symbol
 
 def get_option_chain(company='SPX', date='2024-05-02', strike=4500):
-    ticker = yf.Ticker(company)
-    option_chain = ticker.option_chain(date)
-   
-    call_data = option_chain.calls[option_chain.calls['strike'] == strike]
-    
-    if not call_data.empty:
-        call_symbol = call_data['contractSymbol'].values[0]
-        call_symbol = call_symbol[:next((i for i, char in enumerate(call_symbol) if char.isdigit()), None)]
-        return call_symbol
+    snapshot = get_chain_cache().snapshot(company, date)
+
+    call_data = snapshot.strike(strike, 'C') if snapshot else []
+
+    if call_data:
+        call_symbol = call_data[0]['contractSymbol']
+        # the listed root (SPXW for weeklies), which the index symbol alone does not give
+        return parse_symbol(call_symbol).root
     else:
         return None
 def main(company='SPX', date='2024-05-02', strike=4500):
-    # Fetch ticker information
-    ticker = yf.Ticker(company)
-
-    try:
-        option_chain = ticker.option_chain(date)
-    except ValueError as e:
-        print(f"Error fetching option chain for {date}: {e}")
+    # Served from the shared chain snapshot for (company, date)
+    option_chain = get_chain_cache().snapshot(company, date)
+    if option_chain is None:
         return None
 
     # Check if there are options for the specific strike price
-    calls = option_chain.calls
-    puts = option_chain.puts
-    call_data = calls[calls['strike'] == strike]
-    put_data = puts[puts['strike'] == strike]
+    call_data = option_chain.strike(strike, 'C')
+    put_data = option_chain.strike(strike, 'P')
 
-    if call_data.empty and put_data.empty:
+    if not call_data and not put_data:
         print("No call or put options available for the specified strike price.")
         return None
-    
+
     options = []
     res = [[], [], []]
-    
-    if not call_data.empty:
-        call_symbol = call_data['contractSymbol'].values[0]
+
+    if call_data:
+        call_symbol = call_data[0]['contractSymbol']
         options.append(call_symbol)
-        call_price = call_data['lastPrice'].values[0]
-        call_open_interest = call_data['openInterest'].values[0]
-        call_volume = call_data['volume'].values[0]
+        call_price = call_data[0]['lastPrice']
+        call_open_interest = call_data[0]['openInterest']
+        call_volume = call_data[0]['volume']
         res[0].append(call_price)
         res[1].append(call_open_interest)
         res[2].append(call_volume)
-    
-    if not put_data.empty:
-        put_symbol = put_data['contractSymbol'].values[0]
+
+    if put_data:
+        put_symbol = put_data[0]['contractSymbol']
         options.append(put_symbol)
-        put_price = put_data['lastPrice'].values[0]
-        put_open_interest = put_data['openInterest'].values[0]
-        put_volume = put_data['volume'].values[0]
+        put_price = put_data[0]['lastPrice']
+        put_open_interest = put_data[0]['openInterest']
+        put_volume = put_data[0]['volume']
         res[0].append(put_price)
         res[1].append(put_open_interest)
         res[2].append(put_volume)
@@ -1,42 +1,19 @@
-import yfinance as yf
-from datetime import datetime
-import holidays
-import pytz
+from tools.quotes import get_quote_service
 
 def get_realtime_stock_price(stock_name):
-    stock = yf.Ticker(stock_name)
-    today = datetime.today()
-    
-    # Check for weekends and holidays
-    if today.weekday() > 4 or today in holidays.UnitedStates(years=today.year):
-        todays_data = stock.history(period="1d")
-        if not todays_data.empty:
-            current_price = todays_data['Close'].iloc[-1]
-            previous_close = stock.info.get('regularMarketPreviousClose', current_price)
-            price_change = current_price - previous_close
-            percent_change = round((price_change / previous_close) * 100, 2)
-            status = "closed"
-        else:
-            return None  # No data available
-    else:
-        try:
-            # Try getting current price during market hours
-            current_price = stock.info.get("currentPrice")
-            previous_close = stock.info.get('regularMarketPreviousClose', current_price)
-            if current_price is None:
-                # Fallback if currentPrice is not available
-                todays_data = stock.history(period="1d")
-                if not todays_data.empty:
-                    current_price = todays_data['Close'].iloc[-1]
-            price_change = current_price - previous_close
-            percent_change = round((price_change / previous_close) * 100, 2)
-            status = "open"
-        except Exception as e:
-            print(f"Error retrieving stock data: {e}")
-            return None
+    # One batched snapshot serves every symbol on the watchlist for the refresh interval
+    quote = get_quote_service().quote(stock_name)
+    if quote is None:
+        print(f"No price data available for {stock_name}.")
+        return None
+    current_price, price_change, percent_change = quote
 
     print(f"The current price of {stock_name} is {current_price:.2f}, the price change is {price_change:.2f}, the percent change is {percent_change:.2f}%")
     return current_price, price_change, percent_change
 
+def get_realtime_stock_prices(stock_names):
+    # {symbol: (price, change, percent change)} for many symbols from the same snapshot
+    return get_quote_service().snapshot(stock_names)
+
 # Example usage
 # get_realtime_stock_price("SPY")
@@ -4,13 +4,12 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QSlider, QWidget, QVBoxL
 from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QDate)
 from PyQt5.QtGui import QFont
 from datetime import date, datetime
-from scipy.stats import norm
 import numpy as np
-import pytz
-import holidays
 
 from realPrice.realStock import get_realtime_stock_price
 from realPrice.realOption import get_realtime_option_price, calls_or_puts
+from tools.single_flight import coalesced
+from tools.trading_calendar import get_calendar, EASTERN
 
 class FetchStockThread(QThread):
     data_fetched = pyqtSignal(float, float, float)
@@ -20,7 +19,10 @@ class FetchStockThread(QThread):
         self.stock_name = stock_name
 
     def run(self):
-        price, price_change, percentage_change = get_realtime_stock_price(self.stock_name)
+        quote = fetch_stock_quote(self.stock_name)
+        if quote is None:
+            return
+        price, price_change, percentage_change = quote
         self.data_fetched.emit(round(price, 2), round(price_change, 2), round(percentage_change, 2))
 
 class FetchOptionThread(QThread):
@@ -33,23 +35,28 @@ class FetchOptionThread(QThread):
         self.strike = strike
     
     def market_open(self):
-        eastern = pytz.timezone('US/Eastern')
-        now = datetime.now(eastern)
-        market_open = datetime.strptime("09:30", "%H:%M").time()
-        market_close = datetime.strptime("16:00", "%H:%M").time()
-        us_holidays = holidays.US()
-        if now.date() in us_holidays or now.weekday() >= 5:
-            return False
-        # if market_open <= now.time() <= market_close:
-        #     return True
-        return True
+        # any NYSE session day counts, quotes are still served after the close
+        return get_calendar().is_session(datetime.now(EASTERN).date())
 
     def run(self):
-        prices, ask_prices, bid_prices = ['NA', 'NA'], ['NA', 'NA'], ['NA', 'NA']   
-        
-        options = calls_or_puts(self.company, self.date, self.strike)
-        if options and len(options) == 2:
-            prices[0], ask_prices[0], bid_prices[0] = get_realtime_option_price(options[0])
-            prices[1], ask_prices[1], bid_prices[1] = get_realtime_option_price(options[1])
-
-        self.data_fetched.emit(prices, ask_prices, bid_prices)
+        prices, ask_prices, bid_prices = fetch_option_quotes(self.company, self.date, self.strike)
+        # lists are shared with other threads that joined the same fetch
+        self.data_fetched.emit(list(prices), list(ask_prices), list(bid_prices))
+
+
+# Windows refreshing the same underlying or contract pair at once share one lookup
+@coalesced('stock_quotes')
+def fetch_stock_quote(stock_name):
+    return get_realtime_stock_price(stock_name)
+
+@coalesced('option_quotes')
+def fetch_option_quotes(company, date, strike):
+    prices, ask_prices, bid_prices = ['NA', 'NA'], ['NA', 'NA'], ['NA', 'NA']
+
+    options = calls_or_puts(company, date, strike)
+    if options and len(options) == 2:
+        for i, option in enumerate(options):
+            quote = get_realtime_option_price(option, company)
+            if quote:
+                prices[i], ask_prices[i], bid_prices[i] = quote
+    return prices, ask_prices, bid_prices
@@ -0,0 +1,237 @@
+'''
+Backtests of strategy templates over the local option history.
+
+A template ("sell the ATM straddle 20 sessions before expiry, hedge 0.5") is expanded over
+underlyings, expirations and strike offsets into instances. Every instance is replayed from
+the option_data cache (fetched through the feed provider and stored first when missing)
+on a process pool, and the results are summarised per instance and per template/underlying.
+
+    python -m tools.backtest AAPL MSFT --start 2024-01-01 --end 2024-09-30 \\
+        --template short_straddle --days-before 20 --offsets -1 0 1 --hedge 0.5 --out backtest.csv
+'''
+import os
+import sqlite3
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from tools.pnl_tools import calculate_pnl
+from tools.pnl_db import init_option_db, store_marks, load_marks
+from tools.trading_calendar import get_calendar
+from tools.instrument import timed
+
+DB_PATH = os.environ.get('PNL_DB', 'option_data.db')
+WORKERS = int(os.environ.get('PNL_BACKTEST_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+
+class StrategyTemplate:
+    '''
+    One call/put pair on a single strike, opened `days_before` sessions before expiry at
+    `offset` strike steps from the money, with a fixed effective_delta stock hedge.
+    '''
+    def __init__(self, name, call_action='sell', num_call=1, put_action='sell', num_put=1,
+                 days_before=20, effective_delta=0.0, resolution='1D'):
+        self.name = name
+        self.call_action = call_action
+        self.num_call = num_call
+        self.put_action = put_action
+        self.num_put = num_put
+        self.days_before = days_before
+        self.effective_delta = effective_delta
+        self.resolution = resolution
+
+    def but(self, **changes):
+        return StrategyTemplate(**{**vars(self), **changes})
+
+
+TEMPLATES = {
+    'short_straddle': StrategyTemplate('short_straddle', 'sell', 1, 'sell', 1),
+    'long_straddle': StrategyTemplate('long_straddle', 'buy', 1, 'buy', 1),
+    'short_call': StrategyTemplate('short_call', 'sell', 1, 'sell', 0),
+    'short_put': StrategyTemplate('short_put', 'sell', 0, 'sell', 1),
+    'long_call': StrategyTemplate('long_call', 'buy', 1, 'buy', 0),
+    'long_put': StrategyTemplate('long_put', 'buy', 0, 'buy', 1),
+}
+
+
+def monthly_expirations(start, end):
+    # third Friday of every month, the session before when that Friday is a holiday
+    calendar = get_calendar(start, end)
+    months = pd.date_range(pd.Timestamp(start).replace(day=1), end, freq='MS')
+    fridays = months + pd.to_timedelta((4 - months.weekday) % 7 + 14, unit='D')
+    days = pd.to_datetime(calendar.previous_session(fridays.values.astype('datetime64[D]')))
+    return list(days[(days >= pd.Timestamp(start)) & (days <= pd.Timestamp(end))])
+
+
+def expand(template, symbols, expirations, offsets=(0,), strike_step=1.0, provider=None):
+    '''
+    Instances of `template`: one per symbol, expiration and strike offset. The entry is the
+    session `days_before` sessions ahead of expiry and the strike is rounded from that day's close.
+    '''
+    from realPrice.feed import get_provider
+    provider = provider or get_provider()
+    calendar = get_calendar(*expirations)
+    instances = []
+    for symbol in symbols:
+        first = calendar.sessions_in_range(pd.Timestamp(min(expirations)) - pd.Timedelta(days=3 * template.days_before + 10),
+                                           min(expirations))[0]
+        bars = provider.get_bars(symbol, pd.Timestamp(first), pd.Timestamp(max(expirations)) + pd.Timedelta(days=1))
+        if bars is None or bars.empty:
+            print(f"No bars for {symbol}, skipped.")
+            continue
+        closes = pd.Series(bars['Close'].to_numpy(dtype=float), index=pd.to_datetime(bars['Date']).dt.normalize())
+        for expiration in expirations:
+            sessions = calendar.sessions_in_range(first, pd.Timestamp(expiration) - pd.Timedelta(days=1))
+            if len(sessions) < template.days_before:
+                continue
+            entry = pd.Timestamp(sessions[-template.days_before])
+            spot = closes.asof(entry)
+            if pd.isna(spot):
+                continue
+            atm = round(spot / strike_step) * strike_step
+            for offset in offsets:
+                instances.append({
+                    'template': template.name, 'symbol': symbol, 'strike': float(atm + offset * strike_step),
+                    'expiration': f"{pd.Timestamp(expiration):%Y-%m-%d}", 'entry': f"{entry:%Y-%m-%d}",
+                    'spot': float(spot), 'call_action': template.call_action, 'num_call': template.num_call,
+                    'put_action': template.put_action, 'num_put': template.num_put,
+                    'effective_delta': template.effective_delta, 'resolution': template.resolution,
+                })
+    return instances
+
+
+# One connection per worker process, opened by the pool initializer
+_conn = None
+
+def open_worker(db_path):
+    global _conn
+    _conn = sqlite3.connect(db_path, timeout=60)
+    init_option_db(_conn)
+
+def instance_marks(conn, instance, fetch=True):
+    from realPrice.HisPnl import main as his_main, get_symbol
+    call, put = get_symbol(instance['symbol'], instance['strike'], instance['expiration'])
+    marks = load_marks(conn, call, put, instance['entry'], instance['expiration'], instance['resolution'])
+    if marks.empty and fetch:
+        fetched = his_main(instance['entry'], instance['expiration'], instance['symbol'], instance['strike'],
+                           instance['expiration'], resolution=instance['resolution'])
+        if fetched is not None and not fetched.empty:
+            store_marks(conn, fetched, instance['resolution'])
+            marks = load_marks(conn, call, put, instance['entry'], instance['expiration'], instance['resolution'])
+    return marks
+
+def replay(instance, conn=None, fetch=True):
+    '''
+    P&L path of one instance: the legs are opened at the first mark (ask to buy, bid to sell)
+    and marked at the last price after that, the stock hedge against the entry close.
+    '''
+    marks = instance_marks(conn or _conn, instance, fetch)
+    result = dict(instance, marks=len(marks))
+    marks = marks.dropna(subset=['stock'])
+    if marks.empty:
+        return dict(result, status='no data')
+    call_entry = marks['call_ask' if instance['call_action'] == 'buy' else 'call_bid'].iloc[0]
+    put_entry = marks['put_ask' if instance['put_action'] == 'buy' else 'put_bid'].iloc[0]
+    call_entry = 0.0 if instance['num_call'] == 0 or pd.isna(call_entry) else call_entry
+    put_entry = 0.0 if instance['num_put'] == 0 or pd.isna(put_entry) else put_entry
+    call_mark = marks['call_last'].ffill().fillna(call_entry).to_numpy(dtype=float)
+    put_mark = marks['put_last'].ffill().fillna(put_entry).to_numpy(dtype=float)
+    stock = marks['stock'].to_numpy(dtype=float)
+    pnl = calculate_pnl(instance['call_action'], instance['put_action'], instance['num_call'], call_entry, call_mark,
+                        instance['num_put'], put_entry, put_mark, instance['effective_delta'], stock[0], stock)
+    premium = (instance['num_call'] * call_entry + instance['num_put'] * put_entry) * 100
+    peak = np.maximum.accumulate(np.maximum(pnl, 0))
+    return dict(result, status='ok', opened=f"{marks['timestamp'].iloc[0]:%Y-%m-%d %H:%M}",
+                closed=f"{marks['timestamp'].iloc[-1]:%Y-%m-%d %H:%M}", premium=round(premium, 2),
+                pnl=round(float(pnl[-1]), 2), min_pnl=round(float(pnl.min()), 2), max_pnl=round(float(pnl.max()), 2),
+                max_drawdown=round(float((peak - pnl).max()), 2),
+                return_on_premium=round(float(pnl[-1]) / premium, 4) if premium else np.nan)
+
+def replay_batch(instances, fetch=True):
+    rows = []
+    for instance in instances:
+        # one contract the feed does not know must not take the batch down with it
+        try:
+            rows.append(replay(instance, fetch=fetch))
+        except Exception as e:
+            rows.append(dict(instance, marks=0, status=f"error: {e!r}"))
+    return rows
+
+
+@timed('compute')
+def run_backtest(instances, db_path=DB_PATH, workers=WORKERS, fetch=True):
+    '''
+    Replay every instance and return one row per instance. Batches of instances go to worker
+    processes, each with its own connection to the option_data database.
+    '''
+    if not instances:
+        return pd.DataFrame()
+    if workers <= 1:
+        open_worker(db_path)
+        rows = replay_batch(instances, fetch)
+    else:
+        # a few batches per worker keeps the pool busy without pickling instances one by one
+        batches = [instances[i::workers * 4] for i in range(min(len(instances), workers * 4))]
+        with ProcessPoolExecutor(max_workers=workers, initializer=open_worker, initargs=(db_path,)) as pool:
+            rows = [row for batch in pool.map(replay_batch, batches, [fetch] * len(batches)) for row in batch]
+    results = pd.DataFrame(rows)
+    return results.sort_values(['template', 'symbol', 'expiration', 'strike']).reset_index(drop=True)
+
+
+def summarize(results):
+    '''
+    Per template and underlying: instances replayed, win rate, mean/total/worst/best P&L,
+    mean return on premium and the worst drawdown.
+    '''
+    done = results[results['status'] == 'ok'] if 'status' in results else results
+    if done.empty:
+        return pd.DataFrame()
+    grouped = done.groupby(['template', 'symbol'])
+    summary = grouped.agg(instances=('pnl', 'size'), win_rate=('pnl', lambda p: (p > 0).mean()),
+                          mean_pnl=('pnl', 'mean'), total_pnl=('pnl', 'sum'), worst=('pnl', 'min'),
+                          best=('pnl', 'max'), mean_return=('return_on_premium', 'mean'),
+                          max_drawdown=('max_drawdown', 'max'))
+    return summary.round(4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('symbols', nargs='+')
+    parser.add_argument('--start', required=True, help='first expiration considered')
+    parser.add_argument('--end', required=True, help='last expiration considered')
+    parser.add_argument('--template', default='short_straddle', choices=sorted(TEMPLATES))
+    parser.add_argument('--days-before', type=int, help='sessions before expiry to open')
+    parser.add_argument('--hedge', type=float, help='effective delta of the stock hedge')
+    parser.add_argument('--contracts', type=int, nargs=2, metavar=('CALLS', 'PUTS'))
+    parser.add_argument('--offsets', type=float, nargs='+', default=[0], help='strikes from the money, in steps')
+    parser.add_argument('--strike-step', type=float, default=1.0)
+    parser.add_argument('--resolution', default='1D')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--no-fetch', action='store_true', help='only replay what option_data already has')
+    parser.add_argument('--out', help='write the per-instance results as CSV')
+    args = parser.parse_args()
+
+    changes = {'resolution': args.resolution}
+    if args.days_before is not None:
+        changes['days_before'] = args.days_before
+    if args.hedge is not None:
+        changes['effective_delta'] = args.hedge
+    if args.contracts:
+        changes['num_call'], changes['num_put'] = args.contracts
+    template = TEMPLATES[args.template].but(**changes)
+
+    instances = expand(template, args.symbols, monthly_expirations(args.start, args.end), args.offsets, args.strike_step)
+    results = run_backtest(instances, args.db, args.workers, fetch=not args.no_fetch)
+    if args.out:
+        results.to_csv(args.out, index=False)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(results.drop(columns=['call_action', 'put_action', 'resolution'], errors='ignore').to_string(index=False))
+        print()
+        print(summarize(results).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import os
+import time
+import threading
+
+from tools.single_flight import get_flight
+from tools.instrument import stage
+
+# A chain is reused for this many seconds, one download serves every quote in a refresh
+CHAIN_TTL = float(os.environ.get('PNL_CHAIN_TTL', '15'))
+
+
+class ChainSnapshot:
+    '''
+    One download of option_chain(expiration) with the rows indexed by contractSymbol and by strike.
+    '''
+    def __init__(self, underlying, expiration, calls, puts):
+        self.underlying = underlying
+        self.expiration = expiration
+        self.fetched_at = time.monotonic()
+        self.by_symbol = {}
+        self.by_strike = {'C': {}, 'P': {}}
+        for kind, frame in (('C', calls), ('P', puts)):
+            for row in frame.to_dict('records'):
+                self.by_symbol[row['contractSymbol']] = row
+                self.by_strike[kind].setdefault(float(row['strike']), []).append(row)
+
+    def contract(self, symbol):
+        return self.by_symbol.get(symbol)
+
+    def strike(self, strike, kind):
+        # every contract listed at `strike`, kind is 'C' or 'P'
+        return self.by_strike[kind.upper()].get(float(strike), [])
+
+
+class ChainCache:
+    def __init__(self, ttl=CHAIN_TTL):
+        self.ttl = ttl
+        self.snapshots = {}
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.hits = 0
+
+    def snapshot(self, underlying, expiration):
+        '''
+        The chain for (underlying, expiration), downloaded again only once the cached one is older than ttl.
+        Returns None when Yahoo has no chain for that date.
+        '''
+        key = (underlying, expiration)
+        with self.lock:
+            snap = self.snapshots.get(key)
+            if snap and time.monotonic() - snap.fetched_at < self.ttl:
+                self.hits += 1
+                return snap
+        try:
+            # every window asking for this chain while it downloads waits for the same snapshot
+            return get_flight('chains').do(key, self.download, underlying, expiration)
+        except ValueError as e:
+            print(f"Error fetching option chain for {expiration}: {e}")
+            return None
+
+    def download(self, underlying, expiration):
+        import yfinance as yf
+        with stage('fetch', f'yfinance chain {underlying} {expiration}'):
+            chain = yf.Ticker(underlying).option_chain(expiration)
+        with stage('decode', f'yfinance chain {underlying} {expiration}'):
+            snap = ChainSnapshot(underlying, expiration, chain.calls, chain.puts)
+        with self.lock:
+            self.snapshots[(underlying, expiration)] = snap
+            self.downloads += 1
+        return snap
+
+    def invalidate(self, underlying=None):
+        with self.lock:
+            for key in [k for k in self.snapshots if underlying is None or k[0] == underlying]:
+                del self.snapshots[key]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_chain_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ChainCache()
+    return _cache
+
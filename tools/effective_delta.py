@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from tools.greeks import RATE, DEFAULT_VOL, blsdelta, blsimpv, years_to_expiry
+from tools.instrument import timed
+
+# Daily marks carry a date only, they are taken as of the close
+CLOSE = pd.Timedelta(hours=16)
+# Decimals kept, so the entry value can be typed back in and matched exactly
+DECIMALS = 4
+
+
+def leg_vol(cp_flag, stock, strike, tau, r, bid, ask, last):
+    # vol implied from the mid (the last trade when the quote is one-sided), carried over gaps
+    with np.errstate(invalid='ignore'):
+        quoted = np.isfinite(bid) & np.isfinite(ask) & (bid > 0) & (ask >= bid)
+    price = np.where(quoted, (bid + ask) / 2, last)
+    vol = pd.Series(blsimpv(cp_flag, stock, strike, tau, r, price)).ffill().bfill()
+    return vol.fillna(DEFAULT_VOL).to_numpy()
+
+
+@timed('compute')
+def model_effective_delta(marks, strike, expiration, call_action, num_call, put_action, num_put, r=RATE, vol=None):
+    '''
+    Effective delta of a position at every mark of a load_marks frame, from the model deltas
+    of its legs:
+
+        effective_delta = -(s_c * NC * delta_c + s_p * NP * delta_p)
+
+    with s = +1 to buy and -1 to sell, i.e. the stock (in calculate_pnl's units of 100 shares)
+    that makes the call and put legs delta-neutral. Selling a call and a put gives
+    NC * |delta_c| - NP * |delta_p|, as in the four cases of other/EffectiveDelta.pdf.
+    Vols are implied from each mark (or `vol` for all of them); all marks are one batch.
+    '''
+    if marks.empty:
+        return np.array([], dtype=float)
+    moments = pd.to_datetime(marks['timestamp'])
+    moments = moments.where(moments != moments.dt.normalize(), moments + CLOSE)
+    stock = marks['stock'].ffill().to_numpy(dtype=float)
+    tau = years_to_expiry(pd.Timestamp(expiration), moments)
+    call_sign = 1.0 if call_action == 'buy' else -1.0
+    put_sign = 1.0 if put_action == 'buy' else -1.0
+
+    columns = {side: [marks[f'{side}_{field}'].to_numpy(dtype=float) for field in ('bid', 'ask', 'last')]
+               for side in ('call', 'put')}
+    if vol is None:
+        call_vol = leg_vol('c', stock, strike, tau, r, *columns['call'])
+        put_vol = leg_vol('p', stock, strike, tau, r, *columns['put'])
+    else:
+        call_vol = put_vol = np.full(len(marks), float(vol))
+    call_delta = blsdelta('c', stock, strike, tau, r, call_vol)
+    put_delta = blsdelta('p', stock, strike, tau, r, put_vol)
+    effective_delta = -(call_sign * num_call * call_delta + put_sign * num_put * put_delta)
+    return np.round(effective_delta, DECIMALS) + 0.0
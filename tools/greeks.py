@@ -0,0 +1,224 @@
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from tools.trading_calendar import get_calendar, EASTERN, TRADING_DAYS_PER_YEAR, SESSION_MINUTES
+from tools.instrument import timed
+
+# Risk-free rate used when none is given, as a decimal
+RATE = float(os.environ.get('PNL_RATE', '0.05'))
+# Volatility for legs whose mark gives no implied vol (missing, or below intrinsic)
+DEFAULT_VOL = float(os.environ.get('PNL_DEFAULT_VOL', '0.3'))
+CONTRACT_SIZE = 100
+# Columns of the trades table that identify one position, the rest change with every mark
+POSITION_KEYS = ['symbol', 'strike', 'expiration', 'stock_trade_price', 'effective_delta', 'delta_source',
+                 'call_action_type', 'num_call_contracts', 'put_action_type', 'num_put_contracts']
+
+
+# Vectorised versions of the compiled BlackScholes class: every argument may be a scalar or an
+# array, cp_flag is 'c'/'p' (or an array of them). Expired legs (T <= 0) are worth intrinsic.
+
+def is_call(cp_flag):
+    cp_flag = np.asarray(cp_flag)
+    return cp_flag if cp_flag.dtype == bool else np.char.lower(cp_flag.astype(str)) == 'c'
+
+def d1_d2(S, X, T, r, v):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vol_time = v * np.sqrt(T)
+        d1 = (np.log(S / X) + (r + 0.5 * v * v) * T) / vol_time
+    return d1, d1 - vol_time
+
+def blsprice(cp_flag, S, X, T, r, v):
+    call = is_call(cp_flag)
+    S, X, T, v = np.broadcast_arrays(*map(np.asarray, (S, X, T, v)))
+    d1, d2 = d1_d2(S, X, T, r, v)
+    discount = np.exp(-r * np.maximum(T, 0))
+    price = np.where(call, S * ndtr(d1) - X * discount * ndtr(d2), X * discount * ndtr(-d2) - S * ndtr(-d1))
+    intrinsic = np.where(call, np.maximum(S - X, 0), np.maximum(X - S, 0))
+    return np.where((T > 0) & (v > 0), price, intrinsic)
+
+def blsdelta(cp_flag, S, X, T, r, v):
+    call = is_call(cp_flag)
+    S, X, T, v = np.broadcast_arrays(*map(np.asarray, (S, X, T, v)))
+    d1, _ = d1_d2(S, X, T, r, v)
+    delta = np.where(call, ndtr(d1), ndtr(d1) - 1.0)
+    expired = np.where(call, (S > X).astype(float), -(S < X).astype(float))
+    return np.where((T > 0) & (v > 0), delta, expired)
+
+def blsgreeks(cp_flag, S, X, T, r, v):
+    '''
+    Price and Greeks in one pass: delta, gamma (per $1), vega (per 1.00 of vol) and theta (per year).
+    '''
+    call = is_call(cp_flag)
+    S, X, T, v = np.broadcast_arrays(*map(np.asarray, (S, X, T, v)))
+    live = (T > 0) & (v > 0)
+    d1, d2 = d1_d2(S, X, T, r, v)
+    discount = np.exp(-r * np.maximum(T, 0))
+    pdf = np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gamma = pdf / (S * v * np.sqrt(T))
+        decay = -S * pdf * v / (2 * np.sqrt(T))
+    theta = np.where(call, decay - r * X * discount * ndtr(d2), decay + r * X * discount * ndtr(-d2))
+    return {
+        'price': blsprice(call, S, X, T, r, v),
+        'delta': blsdelta(call, S, X, T, r, v),
+        'gamma': np.where(live, gamma, 0.0),
+        'vega': np.where(live, S * pdf * np.sqrt(np.maximum(T, 0)), 0.0),
+        'theta': np.where(live, theta, 0.0),
+    }
+
+def blsimpv(cp_flag, S, X, T, r, C, tol=1e-6, max_iterations=100):
+    '''
+    Implied vol by bisection on [0, 5] like the compiled blsimpv, all contracts at once.
+    NaN where the price is missing or outside the no-arbitrage range.
+    '''
+    call = is_call(cp_flag)
+    S, X, T, C = np.broadcast_arrays(*map(lambda a: np.asarray(a, dtype=float), (S, X, T, C)))
+    low = np.zeros(S.shape)
+    high = np.full(S.shape, 5.0)
+    for _ in range(max_iterations):
+        mid = (low + high) / 2.0
+        above = blsprice(call, S, X, T, r, mid) > C
+        high = np.where(above, mid, high)
+        low = np.where(above, low, mid)
+        if np.all(high - low < tol):
+            break
+    vol = (low + high) / 2.0
+    lower = blsprice(call, S, X, T, r, 1e-9)
+    upper = blsprice(call, S, X, T, r, 5.0)
+    return np.where(np.isfinite(C) & (T > 0) & (C > lower) & (C < upper), vol, np.nan)
+
+
+def years_to_expiry(expiry, moments):
+    '''
+    Trading-time years from each moment to the close of each expiry, vectorised over both.
+    '''
+    calendar = get_calendar()
+    expiry_close = pd.to_datetime(np.atleast_1d(expiry)).normalize() + pd.Timedelta(hours=23, minutes=59)
+    remaining = calendar.elapsed_minutes(expiry_close) - calendar.elapsed_minutes(moments)
+    return np.maximum(remaining, 0) / (TRADING_DAYS_PER_YEAR * SESSION_MINUTES)
+
+
+def book_legs(trades):
+    '''
+    One row per leg of every position in a trades table: signed quantity (contracts x 100,
+    or hedge shares), the latest mark and the spot it was taken at. Each position contributes
+    a call, a put and the effective_delta stock hedge of calculate_pnl.
+    '''
+    if trades.empty:
+        return pd.DataFrame(columns=['underlying', 'expiry', 'kind', 'strike', 'quantity', 'spot', 'mark', 'mark_time'])
+    # marks without a spot (no underlying tick in the bar) cannot be priced, the one before is used
+    latest = trades.dropna(subset=['stock_close_price']).sort_values('trade_date').drop_duplicates(POSITION_KEYS, keep='last')
+    n = len(latest)
+    call_sign = np.where(latest['call_action_type'].astype(str) == 'buy', 1, -1)
+    put_sign = np.where(latest['put_action_type'].astype(str) == 'buy', 1, -1)
+    underlying = latest['symbol'].astype(str).to_numpy()
+    expiry = pd.to_datetime(latest['expiration']).to_numpy()
+    strike = latest['strike'].to_numpy(dtype=float)
+    spot = latest['stock_close_price'].to_numpy(dtype=float)
+    mark_time = pd.to_datetime(latest['trade_date']).to_numpy()
+    # a model hedge (hedge_delta per mark) is held at its latest value, a typed-in one is constant
+    hedge = latest['effective_delta'].to_numpy(dtype=float)
+    if 'hedge_delta' in latest:
+        hedge = np.where(latest['hedge_delta'].notna(), latest['hedge_delta'].to_numpy(dtype=float), hedge)
+    return pd.DataFrame({
+        'underlying': np.tile(underlying, 3),
+        'expiry': np.tile(expiry, 3),
+        'kind': np.repeat(['call', 'put', 'stock'], n),
+        'strike': np.concatenate([strike, strike, np.full(n, np.nan)]),
+        'quantity': np.concatenate([call_sign * latest['num_call_contracts'].to_numpy() * CONTRACT_SIZE,
+                                    put_sign * latest['num_put_contracts'].to_numpy() * CONTRACT_SIZE,
+                                    hedge * CONTRACT_SIZE]).astype(float),
+        'spot': np.tile(spot, 3),
+        'mark': np.concatenate([latest['call_close_price'].to_numpy(dtype=float),
+                                latest['put_close_price'].to_numpy(dtype=float), spot]),
+        'mark_time': np.tile(mark_time, 3),
+    })
+
+
+class RiskEngine:
+    '''
+    Batch pricer for a book of legs. Implied vols are solved once from the marks, after that
+    revalue() is a handful of array operations over every leg, so a spot or vol move reprices
+    the whole book without touching positions one by one.
+    '''
+    def __init__(self, legs, r=RATE, now=None):
+        self.r = r
+        legs = legs.reset_index(drop=True)
+        self.legs = legs
+        self.now = now or datetime.now(EASTERN).replace(tzinfo=None)
+        self.underlyings, self.underlying_codes = np.unique(legs['underlying'].astype(str).to_numpy(), return_inverse=True)
+        self.option = (legs['kind'] != 'stock').to_numpy()
+        self.cp = np.where(legs['kind'] == 'call', 'c', 'p')
+        self.strike = legs['strike'].to_numpy(dtype=float)
+        self.quantity = legs['quantity'].to_numpy(dtype=float)
+        self.T = years_to_expiry(legs['expiry'], self.now) if len(legs) else np.zeros(0)
+
+        # spot of each underlying at its latest mark, and the vol the marks imply at that time
+        self.base_spot = np.zeros(len(self.underlyings))
+        spot = legs['spot'].to_numpy(dtype=float)
+        self.base_spot[self.underlying_codes] = spot
+        T_mark = years_to_expiry(legs['expiry'], legs['mark_time']) if len(legs) else np.zeros(0)
+        implied = blsimpv(self.cp, spot, self.strike, T_mark, r, legs['mark'].to_numpy(dtype=float))
+        self.sigma = np.where(np.isnan(implied), DEFAULT_VOL, implied)
+
+    def spots(self, spots=None):
+        # per-leg spot from {underlying: price}, missing underlyings keep their last mark
+        base = self.base_spot.copy()
+        for name, price in (spots or {}).items():
+            base[self.underlyings == name] = price
+        return base[self.underlying_codes]
+
+    @timed('compute')
+    def revalue(self, spots=None, vol_shift=0.0):
+        '''
+        Value and dollar Greeks of every leg at the given spots and a parallel vol shift.
+        dollar_gamma is the change in dollar delta for a 1% move, vega is per vol point
+        and theta per trading day.
+        '''
+        S = self.spots(spots)
+        greeks = blsgreeks(self.cp, S, self.strike, self.T, self.r, np.maximum(self.sigma + vol_shift, 1e-6))
+        option = self.option
+        price = np.where(option, greeks['price'], S)
+        delta = np.where(option, greeks['delta'], 1.0)
+        q = self.quantity
+        risk = self.legs[['underlying', 'expiry', 'kind', 'strike', 'quantity']].copy()
+        risk['spot'] = S
+        risk['vol'] = np.where(option, self.sigma + vol_shift, np.nan)
+        risk['value'] = q * price
+        risk['dollar_delta'] = q * delta * S
+        risk['dollar_gamma'] = np.where(option, q * greeks['gamma'] * S * S / 100, 0.0)
+        risk['vega'] = np.where(option, q * greeks['vega'] / 100, 0.0)
+        risk['theta'] = np.where(option, q * greeks['theta'] / TRADING_DAYS_PER_YEAR, 0.0)
+        return risk
+
+    def aggregate(self, risk=None):
+        '''
+        Dollar Greeks summed by underlying, by underlying and expiry, and for the whole book.
+        '''
+        risk = self.revalue() if risk is None else risk
+        columns = ['value', 'dollar_delta', 'dollar_gamma', 'vega', 'theta']
+        by_underlying = risk.groupby('underlying', sort=True)[columns].sum()
+        by_expiry = risk.groupby(['underlying', 'expiry'], sort=True)[columns].sum()
+        book = risk[columns].sum().to_frame('book').T
+        by_underlying.index = pd.MultiIndex.from_arrays([['underlying'] * len(by_underlying), by_underlying.index.astype(str)])
+        by_expiry.index = pd.MultiIndex.from_arrays([['expiry'] * len(by_expiry),
+                                                     [f"{u} {pd.Timestamp(e):%Y-%m-%d}" for u, e in by_expiry.index]])
+        book.index = pd.MultiIndex.from_arrays([['book'], ['all']])
+        table = pd.concat([by_underlying, by_expiry, book])
+        table.index.names = ['level', 'group']
+        return table
+
+
+def book_risk(trades, r=RATE, now=None):
+    return RiskEngine(book_legs(trades), r, now).aggregate()
+
+def risk_summary(trades):
+    # "Book Δ$ 12,345  Γ$ 123 /1%  vega 456  θ -78/day" for the status area
+    if trades.empty:
+        return ''
+    book = book_risk(trades).loc[('book', 'all')]
+    return (f"Book Δ$ {book['dollar_delta']:,.0f}  Γ$ {book['dollar_gamma']:,.0f} /1%  "
+            f"vega {book['vega']:,.0f}  θ {book['theta']:,.0f}/day")
@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import pandas as pd
+
+from tools.greeks import POSITION_KEYS, DEFAULT_VOL, RATE, CONTRACT_SIZE, blsgreeks, blsimpv, years_to_expiry
+from tools.instrument import timed, count
+
+# Commission per share and slippage in basis points of the traded notional
+COST_PER_SHARE = float(os.environ.get('PNL_HEDGE_COST_PER_SHARE', '0.005'))
+COST_BPS = float(os.environ.get('PNL_HEDGE_COST_BPS', '1.0'))
+# Daily marks carry a date only, they are taken as of the close
+CLOSE = pd.Timedelta(hours=16)
+
+
+class HedgeSimulation:
+    '''
+    Positions x marks arrays of one simulation: prices, model deltas, the hedge held after
+    each rebalance and the running P&L of the option legs, the hedge, costs and the
+    fixed effective_delta hedge of the apps for comparison. `summary` has one row per position.
+    '''
+    def __init__(self, positions, times, valid, **paths):
+        self.positions = positions
+        self.times = times
+        self.valid = valid
+        for name, values in paths.items():
+            setattr(self, name, values)
+        self.summary = self.summarize()
+
+    def path(self, i):
+        # one position's marks as a frame, for plotting next to the static P&L
+        n = int(self.valid[i].sum())
+        return pd.DataFrame({'time': self.times[i, :n], 'stock': self.stock[i, :n], 'shares': self.shares[i, :n],
+                             'option_pnl': self.option_pnl[i, :n], 'hedge_pnl': self.hedge_pnl[i, :n],
+                             'costs': self.costs[i, :n], 'hedged_pnl': self.hedged_pnl[i, :n],
+                             'static_pnl': self.static_pnl[i, :n]})
+
+    def summarize(self):
+        last = self.valid.sum(axis=1) - 1
+        rows = np.arange(len(last))
+        stats = {'marks': last + 1}
+        for name in ['option_pnl', 'hedge_pnl', 'costs', 'hedged_pnl', 'static_pnl']:
+            stats[name] = getattr(self, name)[rows, last]
+        traded = np.abs(np.diff(self.shares, axis=1, prepend=0.0)) * self.valid
+        stats['turnover_shares'] = traded.sum(axis=1)
+        stats['turnover_notional'] = (traded * self.stock).sum(axis=1)
+        stats['rebalances'] = (traded > 0).sum(axis=1)
+        for name, values in self.attribution.items():
+            stats[f"{name}_pnl"] = (values * self.valid).sum(axis=1)
+        return pd.concat([self.positions, pd.DataFrame(stats).round(2)], axis=1)
+
+
+def pad(groups, columns):
+    # ragged per-position series as positions x longest arrays, the last value repeated past the end
+    length = max(len(g) for g in groups)
+    out = {}
+    for column in columns:
+        values = [g[column].to_numpy() for g in groups]
+        dtype = values[0].dtype if column == 'trade_date' else float
+        array = np.empty((len(groups), length), dtype=dtype)
+        for i, v in enumerate(values):
+            array[i, :len(v)] = v
+            array[i, len(v):] = v[-1]
+        out[column] = array
+    valid = np.arange(length)[None, :] < np.array([len(g) for g in groups])[:, None]
+    return out, valid
+
+
+def ffill_rows(values, fallback):
+    # carry each row's last finite value forward, fallback before the first one
+    filled = pd.DataFrame(values).ffill(axis=1).to_numpy()
+    return np.where(np.isfinite(filled), filled, fallback)
+
+
+@timed('compute')
+def simulate_hedging(trades, r=RATE, vol=None, cost_per_share=COST_PER_SHARE, cost_bps=COST_BPS, band=0.0):
+    '''
+    Delta-hedge every position of a trades table at each of its marks.
+
+    At every mark the option legs are repriced (vol implied from each leg's mark, or `vol`)
+    and the stock hedge is reset to the shares that make the position delta-neutral, unless
+    it is within `band` shares of that already. Costs are charged on every share traded.
+    All positions and marks are computed as positions x marks arrays; only a non-zero band
+    steps through the marks, still vectorised over positions.
+    '''
+    keys = POSITION_KEYS + ['resolution']
+    ordered = trades.sort_values('trade_date')
+    groups = [g for _, g in ordered.groupby(keys, observed=True, sort=False) if len(g)]
+    if not groups:
+        return None
+    positions = pd.DataFrame([g.iloc[0][keys] for g in groups]).reset_index(drop=True)
+    data, valid = pad(groups, ['trade_date', 'stock_close_price', 'call_close_price', 'put_close_price',
+                               'call_trade_price', 'put_trade_price'])
+    P, T = valid.shape
+    count('hedge_cells', int(valid.sum()))
+
+    times = pd.to_datetime(data['trade_date'].ravel())
+    times = np.where(times == times.normalize(), times + CLOSE, times)
+    expiry = np.repeat(pd.to_datetime(positions['expiration']).to_numpy(), T)
+    tau = years_to_expiry(expiry, times).reshape(P, T)
+
+    strike = positions['strike'].to_numpy(dtype=float)[:, None]
+    call_sign = np.where(positions['call_action_type'].astype(str) == 'buy', 1.0, -1.0)[:, None]
+    put_sign = np.where(positions['put_action_type'].astype(str) == 'buy', 1.0, -1.0)[:, None]
+    num_call = positions['num_call_contracts'].to_numpy(dtype=float)[:, None]
+    num_put = positions['num_put_contracts'].to_numpy(dtype=float)[:, None]
+    stock = ffill_rows(data['stock_close_price'], np.nan)
+    stock = np.where(np.isfinite(stock), stock, np.nanmean(stock, axis=1, keepdims=True))
+    call_entry = data['call_trade_price'][:, :1]
+    put_entry = data['put_trade_price'][:, :1]
+    # a leg is worth its entry price until its first mark, so it shows no P&L before it trades
+    call = ffill_rows(data['call_close_price'], call_entry)
+    put = ffill_rows(data['put_close_price'], put_entry)
+
+    if vol is None:
+        call_vol = ffill_rows(blsimpv('c', stock, strike, tau, r, call), DEFAULT_VOL)
+        put_vol = ffill_rows(blsimpv('p', stock, strike, tau, r, put), DEFAULT_VOL)
+    else:
+        call_vol = put_vol = np.full((P, T), float(vol))
+    cg = blsgreeks('c', stock, strike, tau, r, call_vol)
+    pg = blsgreeks('p', stock, strike, tau, r, put_vol)
+
+    # option legs per share of underlying exposure, in contract units
+    weight_call = call_sign * num_call * CONTRACT_SIZE
+    weight_put = put_sign * num_put * CONTRACT_SIZE
+    target = -(weight_call * cg['delta'] + weight_put * pg['delta'])
+    shares = target if band <= 0 else banded(target, band)
+    shares = np.where(valid, shares, np.take_along_axis(shares, valid.sum(axis=1, keepdims=True) - 1, axis=1))
+
+    option_pnl = weight_call * (call - call_entry) + weight_put * (put - put_entry)
+    moves = np.diff(stock, axis=1, prepend=stock[:, :1])
+    held = np.concatenate([np.zeros((P, 1)), shares[:, :-1]], axis=1)
+    hedge_pnl = np.cumsum(held * moves, axis=1)
+    traded = np.abs(np.diff(shares, axis=1, prepend=0.0)) * valid
+    costs = np.cumsum(traded * (cost_per_share + stock * cost_bps / 10000), axis=1)
+    static_pnl = option_pnl + positions['effective_delta'].to_numpy(dtype=float)[:, None] * CONTRACT_SIZE * \
+        (stock - positions['stock_trade_price'].to_numpy(dtype=float)[:, None])
+
+    # first-order attribution of each step with the Greeks at the start of the step
+    def previous(values):
+        return np.concatenate([values[:, :1], values[:, :-1]], axis=1)
+    step_years = np.maximum(previous(tau) - tau, 0)
+    option_move = np.diff(option_pnl, axis=1, prepend=option_pnl[:, :1])
+    book = {greek: weight_call * previous(cg[greek]) + weight_put * previous(pg[greek]) for greek in ['delta', 'gamma', 'theta']}
+    vega = weight_call * previous(cg['vega']) * np.diff(call_vol, axis=1, prepend=call_vol[:, :1]) + \
+        weight_put * previous(pg['vega']) * np.diff(put_vol, axis=1, prepend=put_vol[:, :1])
+    attribution = {
+        'delta': book['delta'] * moves + held * moves,
+        'gamma': 0.5 * book['gamma'] * moves ** 2,
+        'theta': book['theta'] * step_years,
+        'vega': vega,
+    }
+    attribution['residual'] = option_move + held * moves - sum(attribution.values())
+    attribution['cost'] = -traded * (cost_per_share + stock * cost_bps / 10000)
+
+    return HedgeSimulation(positions, pd.to_datetime(times).to_numpy().reshape(P, T), valid,
+                           stock=stock, shares=shares, call_vol=call_vol, put_vol=put_vol,
+                           option_pnl=option_pnl, hedge_pnl=hedge_pnl, costs=costs,
+                           hedged_pnl=option_pnl + hedge_pnl - costs, static_pnl=static_pnl,
+                           attribution=attribution)
+
+
+def banded(target, band):
+    # rebalance only when the hedge is more than `band` shares off target, all positions per step
+    shares = np.empty_like(target)
+    held = np.zeros(target.shape[0])
+    for t in range(target.shape[1]):
+        move = np.abs(target[:, t] - held) > band
+        held = np.where(move | (t == 0), target[:, t], held)
+        shares[:, t] = held
+    return shares
@@ -0,0 +1,132 @@
+'''
+Implied vols of the marks stored in option_data.
+
+Every row gets the bid, mid and ask vol of its call and put and its time to expiry (`tau`, in
+trading years), solved in batches of rows with the array pricer and written back next to the
+marks. Only rows with no `tau` yet are read, so a run after new marks were stored (or existing
+ones updated) solves just those rows.
+
+    python -m tools.implied_vol --db option_data.db
+'''
+import os
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from tools.greeks import RATE, blsimpv, years_to_expiry
+from tools.pnl_db import init_option_db, IV_COLUMNS
+from tools.instrument import timed, count
+from tools.symbology import parse_symbols
+
+DB_PATH = os.environ.get('PNL_DB', 'option_data.db')
+# Rows solved and written per batch
+BATCH_ROWS = int(os.environ.get('PNL_IV_BATCH', str(50_000)))
+# Daily marks carry a date only, they are taken as of the close
+CLOSE = pd.Timedelta(hours=16)
+
+
+def contract_terms(names):
+    # expiry and strike arrays for a column of names, each distinct name parsed once
+    terms = parse_symbols(names)
+    return pd.DatetimeIndex(terms['expiration']), terms['strike'].to_numpy(dtype=float)
+
+
+def solve_rows(rows, r=RATE):
+    '''
+    Implied vols and tau of a frame of option_data rows, one column per IV_COLUMNS entry.
+    All six vols of the batch are one call of the bisection solver.
+    '''
+    moments = pd.to_datetime(rows['timestamp'], format='ISO8601')
+    moments = moments.where(moments != moments.dt.normalize(), moments + CLOSE)
+    stock = rows['stock'].to_numpy(dtype=float)
+    call_expiry, call_strike = contract_terms(rows['call_option'])
+    put_expiry, put_strike = contract_terms(rows['put_option'])
+    # both legs of a pair share the expiry, the call's is used when one name is missing
+    expiry = call_expiry.where(call_expiry.notna(), put_expiry)
+    known = np.asarray(expiry.notna())
+    tau = np.full(len(rows), np.nan)
+    if known.any():
+        tau[known] = years_to_expiry(expiry[known], moments[known])
+
+    prices, flags, strikes = [], [], []
+    for side, flag, strike in (('call', 'c', call_strike), ('put', 'p', put_strike)):
+        bid = rows[f'{side}_bid'].to_numpy(dtype=float)
+        ask = rows[f'{side}_ask'].to_numpy(dtype=float)
+        for price in (bid, (bid + ask) / 2, ask):
+            prices.append(price)
+            flags.append(np.full(len(rows), flag))
+            strikes.append(strike)
+    n = len(prices)
+    vols = blsimpv(np.concatenate(flags), np.tile(stock, n), np.concatenate(strikes), np.tile(tau, n), r,
+                   np.concatenate(prices)).reshape(n, len(rows))
+    solved = pd.DataFrame(dict(zip(IV_COLUMNS[:-1], vols)), index=rows.index)
+    solved['tau'] = tau
+    return solved
+
+
+@timed('compute')
+def backfill_iv(conn, r=RATE, batch_rows=BATCH_ROWS):
+    '''
+    Solve and store the implied vols of every option_data row without them, in id order.
+    Returns the number of rows solved. Rows whose contract names cannot be parsed keep a NULL
+    tau and are tried again on the next run.
+    '''
+    init_option_db(conn)
+    cursor = conn.cursor()
+    fields = ['id', 'timestamp', 'call_option', 'call_bid', 'call_ask', 'put_option', 'put_bid', 'put_ask', 'stock']
+    last_id = 0
+    solved_rows = 0
+    while True:
+        cursor.execute(f'''
+            SELECT {', '.join(fields)} FROM option_data
+            WHERE tau IS NULL AND id > ? ORDER BY id LIMIT ?
+        ''', (last_id, batch_rows))
+        rows = pd.DataFrame(cursor.fetchall(), columns=fields)
+        if rows.empty:
+            break
+        last_id = int(rows['id'].iloc[-1])
+        solved = solve_rows(rows, r)
+        solved = solved.astype(object).where(solved.notna(), None)
+        solved['id'] = rows['id']
+        cursor.executemany(f'''
+            UPDATE option_data SET {', '.join(f'{c} = ?' for c in IV_COLUMNS)} WHERE id = ?
+        ''', list(solved[IV_COLUMNS + ['id']].itertuples(index=False, name=None)))
+        conn.commit()
+        solved_rows += len(rows)
+        count('iv_rows_solved', len(rows))
+    return solved_rows
+
+
+@timed('db')
+def load_iv(conn, call_option, put_option, start, end, resolution='1D'):
+    '''
+    Stored implied vols of a contract pair between two dates, for charting next to the marks.
+    '''
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT timestamp, stock, {', '.join(IV_COLUMNS)}
+        FROM option_data WHERE call_option = ? AND put_option = ? AND resolution = ? AND timestamp BETWEEN ? AND ?
+        ORDER BY timestamp
+    ''', (call_option, put_option, resolution, start, f"{end} 23:59:59"))
+    df = pd.DataFrame(cursor.fetchall(), columns=['timestamp', 'stock'] + IV_COLUMNS)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601')
+    return df.astype({c: float for c in ['stock'] + IV_COLUMNS})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--batch', type=int, default=BATCH_ROWS, help='rows solved per batch')
+    parser.add_argument('--rate', type=float, default=RATE)
+    args = parser.parse_args()
+    conn = sqlite3.connect(args.db)
+    solved = backfill_iv(conn, args.rate, args.batch)
+    pending = conn.execute('SELECT COUNT(*) FROM option_data WHERE tau IS NULL').fetchone()[0]
+    print(f"Solved {solved} rows, {pending} without a parsable contract left.")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+import os
+import sys
+import json
+import time
+import logging
+import threading
+import functools
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+STAGES = ['fetch', 'decode', 'aggregate', 'db', 'compute', 'render']
+# One JSON object per finished stage and per user action
+METRICS_LOG = os.environ.get('PNL_METRICS_LOG', os.path.join('cache', 'metrics.jsonl'))
+# Totals written by export_metrics(), the apps export on close
+METRICS_FILE = os.environ.get('PNL_METRICS_FILE', os.path.join('cache', 'metrics.json'))
+# PNL_PROFILE=1 samples every user action, or a comma separated list of action names ("add_trade")
+PROFILE = os.environ.get('PNL_PROFILE', '')
+PROFILE_DIR = os.environ.get('PNL_PROFILE_DIR', os.path.join('cache', 'profiles'))
+PROFILE_INTERVAL = float(os.environ.get('PNL_PROFILE_INTERVAL', '0.005'))
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def add(self, seconds):
+        self.calls += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.last = seconds
+
+    def as_dict(self):
+        return {'calls': self.calls, 'total_s': round(self.total, 6), 'max_s': round(self.max, 6),
+                'mean_s': round(self.total / self.calls, 6) if self.calls else 0.0}
+
+
+class Metrics:
+    '''
+    Process-wide stage timers and counters.
+    Stage time is exclusive: a db stage inside an aggregate stage is not counted twice.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = defaultdict(StageStats)
+        self.counters = Counter()
+        self.local = threading.local()
+        self.actions = []
+        self.logger = None
+
+    def log(self, record):
+        if self.logger is None:
+            self.logger = logging.getLogger('pnl.metrics')
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            try:
+                os.makedirs(os.path.dirname(METRICS_LOG) or '.', exist_ok=True)
+                handler = logging.FileHandler(METRICS_LOG)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self.logger.addHandler(handler)
+            except OSError as e:
+                print(f"Metrics log disabled: {e}")
+        record['at'] = datetime.now().isoformat(timespec='milliseconds')
+        self.logger.info(json.dumps(record, default=str))
+
+    @contextmanager
+    def stage(self, name, label=None):
+        stack = self.local.__dict__.setdefault('stack', [])
+        frame = {'children': 0.0}
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1]['children'] += elapsed
+            own = elapsed - frame['children']
+            with self.lock:
+                self.stages[name].add(own)
+                for action in self.actions:
+                    action.stages[name] += own
+            self.log({'event': 'stage', 'stage': name, 'label': label, 'seconds': round(own, 6),
+                      'thread': threading.current_thread().name})
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+            for action in self.actions:
+                action.counters[name] += n
+
+    def snapshot(self):
+        with self.lock:
+            return {'stages': {name: stats.as_dict() for name, stats in self.stages.items()},
+                    'counters': dict(self.counters)}
+
+
+class Action:
+    def __init__(self, name):
+        self.name = name
+        self.stages = defaultdict(float)
+        self.counters = Counter()
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+        self.profile_path = None
+
+    def summary(self):
+        # "1.82s: fetch 1.20s, db 0.05s, render 0.40s" for the status bar
+        parts = [f"{stage} {self.stages[stage]:.2f}s" for stage in STAGES if self.stages.get(stage)]
+        return f"{self.seconds:.2f}s" + (f": {', '.join(parts)}" if parts else '')
+
+
+class SamplingProfiler:
+    '''
+    Samples every thread's stack at a fixed interval and writes collapsed stacks
+    ("thread;outer;...;inner count" lines) that flamegraph.pl or speedscope can draw.
+    '''
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='pnl-profiler', daemon=True)
+
+    def run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, path):
+        self.stopped.set()
+        self.thread.join()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+_metrics = Metrics()
+
+def get_metrics():
+    return _metrics
+
+def stage(name, label=None):
+    '''
+    Time a block as one of STAGES, usable as `with stage('db'):` or as a decorator.
+    '''
+    return _metrics.stage(name, label)
+
+def timed(name):
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            with _metrics.stage(name, fn.__qualname__):
+                return fn(*args, **kwargs)
+        return call
+    return wrap
+
+def count(name, n=1):
+    _metrics.count(name, n)
+
+def profiling(action_name):
+    return PROFILE == '1' or action_name in [name.strip() for name in PROFILE.split(',')]
+
+@contextmanager
+def action(name):
+    '''
+    Group everything timed while a user action runs; yields the Action so the caller can
+    show action.summary() once the block is done. Sampled when PNL_PROFILE selects it.
+    '''
+    current = Action(name)
+    profiler = SamplingProfiler() if profiling(name) else None
+    if profiler:
+        profiler.start()
+    with _metrics.lock:
+        _metrics.actions.append(current)
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - current.start
+        with _metrics.lock:
+            _metrics.actions.remove(current)
+            _metrics.stages[f'action:{name}'].add(current.seconds)
+        if profiler:
+            path = os.path.join(PROFILE_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.folded")
+            current.profile_path = profiler.stop(path)
+            print(f"Profile of {name} written to {path}")
+        _metrics.log({'event': 'action', 'action': name, 'seconds': round(current.seconds, 6),
+                      'stages': {k: round(v, 6) for k, v in current.stages.items()},
+                      'counters': dict(current.counters), 'profile': current.profile_path})
+
+def export_metrics(path=METRICS_FILE):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(_metrics.snapshot(), f, indent=2)
+    return path
@@ -0,0 +1,111 @@
+import pandas as pd
+
+from tools.instrument import timed, count
+from tools.schema import as_marks
+
+MARK_COLUMNS = ['timestamp', 'call_last', 'call_bid', 'call_ask', 'call_option',
+                'put_last', 'put_bid', 'put_ask', 'put_option', 'stock']
+# Filled by tools.implied_vol; tau is the time to expiry in years, NULL until a row is solved
+IV_COLUMNS = ['call_iv_bid', 'call_iv_mid', 'call_iv_ask', 'put_iv_bid', 'put_iv_mid', 'put_iv_ask', 'tau']
+
+
+def init_option_db(conn):
+    cursor = conn.cursor()
+    # Create table for storing option data
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS option_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            call_last REAL,
+            call_bid REAL,
+            call_ask REAL,
+            call_option TEXT,
+            put_last REAL,
+            put_bid REAL,
+            put_ask REAL,
+            put_option TEXT,
+            stock REAL
+        )
+    ''')
+    # Databases created before intraday marks hold daily rows only
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(option_data)')]
+    if 'resolution' not in columns:
+        cursor.execute("ALTER TABLE option_data ADD COLUMN resolution TEXT DEFAULT '1D'")
+    for column in IV_COLUMNS:
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE option_data ADD COLUMN {column} REAL")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS option_data_pair
+        ON option_data (call_option, put_option, resolution, timestamp)
+    ''')
+    # rows still waiting for implied vols, so a backfill never scans the solved ones
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS option_data_unsolved
+        ON option_data (id) WHERE tau IS NULL
+    ''')
+    conn.commit()
+
+def columns(df, fields):
+    # parameter tuples for executemany
+    return list(zip(*(df[f].tolist() for f in fields)))
+
+@timed('db')
+def store_marks(conn, df, resolution='1D'):
+    '''
+    Insert or update the rows of a HisPnl/IndexPnl frame, keyed by contract pair, timestamp and resolution.
+    Existing keys are looked up once per pair and the writes go out as two batches.
+    '''
+    if df is None or df.empty:
+        return
+    cursor = conn.cursor()
+    df = df.copy()
+    df['Timestamp'] = df['Timestamp'].astype(str)
+    df['Resolution'] = resolution
+    df = df.astype(object).where(df.notna(), None)
+    count('db_rows_written', len(df))
+
+    for (call_option, put_option), group in df.groupby(['Call Option', 'Put Option'], sort=False, dropna=False):
+        cursor.execute('''
+            SELECT timestamp FROM option_data
+            WHERE call_option IS ? AND put_option IS ? AND resolution = ?
+        ''', (call_option, put_option, resolution))
+        existing = {row[0] for row in cursor.fetchall()}
+        is_update = group['Timestamp'].isin(existing)
+
+        # new quotes on an existing row clear tau, so its implied vols are solved again
+        updates = group[is_update]
+        cursor.executemany('''
+            UPDATE option_data
+            SET call_last = ?, call_bid = ?, call_ask = ?, put_last = ?, put_bid = ?, put_ask = ?, stock = ?, tau = NULL
+            WHERE call_option IS ? AND put_option IS ? AND timestamp = ? AND resolution = ?
+        ''', columns(updates, ['Call Last', 'Call Bid', 'Call Ask', 'Put Last', 'Put Bid', 'Put Ask', 'Stock',
+                            'Call Option', 'Put Option', 'Timestamp', 'Resolution']))
+
+        inserts = group[~is_update]
+        cursor.executemany('''
+            INSERT INTO option_data (timestamp, call_last, call_bid, call_ask, call_option, put_last, put_bid, put_ask, put_option, stock, resolution)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', columns(inserts, ['Timestamp', 'Call Last', 'Call Bid', 'Call Ask', 'Call Option',
+                            'Put Last', 'Put Bid', 'Put Ask', 'Put Option', 'Stock', 'Resolution']))
+
+    conn.commit()
+
+@timed('db')
+def load_marks(conn, call_option, put_option, start, end, resolution='1D'):
+    # end is a date, intraday stamps on that day sort after it as strings
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT {', '.join(MARK_COLUMNS)}
+        FROM option_data WHERE call_option = ? AND put_option = ? AND resolution = ? AND timestamp BETWEEN ? AND ?
+        ORDER BY timestamp
+    ''', (call_option, put_option, resolution, start, f"{end} 23:59:59"))
+    return as_marks(pd.DataFrame(cursor.fetchall(), columns=MARK_COLUMNS))
+
+@timed('db')
+def count_marks(conn, call_option, put_option, start, end, resolution='1D'):
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*) FROM option_data
+        WHERE call_option = ? AND put_option = ? AND resolution = ? AND timestamp BETWEEN ? AND ?
+    ''', (call_option, put_option, resolution, start, f"{end} 23:59:59"))
+    return cursor.fetchone()[0]
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+from tools.resample import decimate, is_intraday
+from tools.instrument import timed, count
+
+# More points than this are decimated before drawing, hover still reports the real rows
+MAX_PLOT_POINTS = 2000
+MAX_TICKS = 12
+
+
+@timed('render')
+def plot_pnl(figure, canvas, filtered_data, subtitle, resolution='1D'):
+    import mplcursors
+    filtered_data = filtered_data.sort_values(by='trade_date')
+    trade_dates = pd.to_datetime(filtered_data['trade_date']).reset_index(drop=True)
+    pnl = filtered_data['daily_pnl'].to_numpy(dtype=float)
+
+    shown = decimate(pnl, MAX_PLOT_POINTS)
+    count('points_plotted', len(shown))
+    colors = np.where(pnl[shown] < 0, '#bd1414', '#007560')
+    marker_size = 100 if len(shown) <= 100 else 20
+
+    label_format = '%m-%d %H:%M' if is_intraday(resolution) else '%m-%d'
+    ticks = shown[np.linspace(0, len(shown) - 1, min(len(shown), MAX_TICKS)).astype(int)]
+    rows = filtered_data.reset_index(drop=True)
+
+    def hover_text(i):
+        row = rows.iloc[i]
+        return f"Date: {trade_dates[i].strftime('%Y-%m-%d %H:%M:%S' if is_intraday(resolution) else '%Y-%m-%d')}\n" \
+               f"Stock: ${row['stock_close_price']:.2f}\n" \
+               f"Call: ${row['call_close_price']:.2f}\n" \
+               f"Put: ${row['put_close_price']:.2f}\n" \
+               f"Current PNL: ${row['daily_pnl']:.2f}\n" \
+               f"Change: {row['change']:.2f}%"
+
+    figure.clear()
+    ax = figure.add_subplot(111)
+
+    scatter = ax.scatter(shown, pnl[shown], c=colors, s=marker_size)
+    ax.plot(shown, pnl[shown], color='black', linewidth=2)
+
+    ax.set_title(f"Profit & Loss\n{subtitle}", fontsize=14)
+    ax.set_xlabel('Date', fontdict={'fontsize': 14})
+    ax.set_ylabel('Π', fontdict={'fontsize': 14})
+    ax.axhline(y=0, color='black', linestyle='--', linewidth=2)
+    ax.grid(True)
+
+    ax.set_xticks(ticks)
+    ax.set_xticklabels([trade_dates[i].strftime(label_format) for i in ticks], rotation=45, ha='right')
+
+    ax.tick_params(axis='x', labelsize=10)
+    ax.tick_params(axis='y', labelsize=10)
+
+    # hover text is formatted only for the point under the cursor
+    cursor = mplcursors.cursor(scatter, hover=True)
+    cursor.connect("add", lambda sel: sel.annotation.set_text(hover_text(shown[sel.index])))
+    canvas.draw()
+
+
+@timed('render')
+def plot_heatmap(figure, canvas, table, title, label='Final P&L'):
+    # rows x columns of a pivot table (strike x effective delta for a sweep), red below zero
+    from matplotlib.colors import TwoSlopeNorm
+    values = table.to_numpy(dtype=float)
+    figure.clear()
+    ax = figure.add_subplot(111)
+    finite = values[np.isfinite(values)]
+    low, high = (finite.min(), finite.max()) if finite.size else (-1.0, 1.0)
+    norm = TwoSlopeNorm(vcenter=0, vmin=min(low, -1e-9), vmax=max(high, 1e-9))
+    image = ax.imshow(values, aspect='auto', origin='lower', cmap='RdYlGn', norm=norm)
+    ax.set_xticks(range(len(table.columns)))
+    ax.set_xticklabels([f"{c:g}" for c in table.columns], rotation=45, ha='right')
+    ax.set_yticks(range(len(table.index)))
+    ax.set_yticklabels([f"{i:g}" for i in table.index])
+    ax.set_xlabel(table.columns.name or '', fontdict={'fontsize': 14})
+    ax.set_ylabel(table.index.name or '', fontdict={'fontsize': 14})
+    ax.set_title(title, fontsize=14)
+    if values.size <= 400:
+        for (i, j), value in np.ndenumerate(values):
+            if np.isfinite(value):
+                ax.text(j, i, f"{value:,.0f}", ha='center', va='center', fontsize=8)
+    figure.colorbar(image, ax=ax, label=label)
+    canvas.draw()
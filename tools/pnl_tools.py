@@ -1,14 +1,13 @@
-from datetime import datetime
-import pytz
+import numpy as np
 import pandas as pd
-import yfinance as yf
-import holidays
-import pytz
-import requests
 
+from tools.polygon_client import get_client
+from tools.price_store import get_bar_store
+from tools.trading_calendar import get_calendar
+from tools.instrument import timed
+from tools.schema import TRADE_SCHEMA, apply_schema
+from tools.symbology import option_pair, parse_symbol
 
-api_key = 'C6ig1sXku2yKl_XEIvSvc_OWCwB8ILLn'
-base_url = 'https://api.polygon.io/v2/aggs/ticker/'
 def calculate_pnl(call_action, put_action, NC, C_0, C_t, NP, P_0, P_t, effectice_delta, trade_price, current_price):
         if call_action == "sell" and put_action == "sell":
             return (NC * (C_0 - C_t) + NP * (P_0 - P_t) + effectice_delta * (current_price - trade_price)) * 100
@@ -21,40 +20,35 @@ def calculate_pnl(call_action, put_action, NC, C_0, C_t, NP, P_0, P_t, effectice
         else:
             return 0  
 
+def rebalanced_hedge_pnl(hedge_delta, trade_price, current_price):
+    # stock hedge reset to hedge_delta at every mark and held to the next one, opened at trade_price;
+    # a constant hedge_delta gives calculate_pnl's effective_delta term
+    current_price = np.asarray(current_price, dtype=float)
+    price = pd.Series(current_price).ffill().fillna(trade_price).to_numpy()
+    held = pd.Series(hedge_delta, dtype=float).ffill().fillna(0.0).to_numpy()
+    moves = np.diff(price, prepend=trade_price)
+    pnl = np.cumsum(np.concatenate([held[:1], held[:-1]]) * moves) * 100
+    return np.where(np.isnan(current_price), np.nan, pnl)
+
+def entry_delta(hedge_delta):
+    # the first value of a per-mark effective_delta series that has one
+    finite = np.asarray(hedge_delta, dtype=float)
+    finite = finite[np.isfinite(finite)]
+    return float(finite[0]) if len(finite) else 0.0
+
 def market_open():
-    today = datetime.now()  
-    eastern = pytz.timezone('US/Eastern')
-    current_time_et = datetime.now(eastern).time()
-    market_open = datetime.strptime("09:30", "%H:%M").time()
-    market_close = datetime.strptime("16:00", "%H:%M").time()
-    return market_open <= current_time_et <= market_close and today.weekday() < 5 and today not in holidays.US() 
+    # regular NYSE hours, holidays and early closes from the shared calendar
+    return get_calendar().is_open()
 
 def get_historical_data(ticker, start_date):
-    end_date = datetime.now()
     ticker = f'O:{ticker}'
-    if isinstance(start_date, datetime):
-        start_date = start_date.strftime('%Y-%m-%d')
-
-    url = f"{base_url}{ticker}/range/1/day/{start_date}/{end_date.strftime('%Y-%m-%d')}?apiKey={api_key}"
-    response = requests.get(url)
-    
-    if response.status_code == 200:
-        data = response.json()
-        if 'results' in data:
-            df = pd.DataFrame(data['results'])
-            df['t'] = pd.to_datetime(df['t'], unit='ms')
-            df['date'] = df['t'].dt.date
-            print(f"Retrieved historical data for {ticker}: {df.head()}")
-            return df[['date', 'c']], None
-        else:
-            return pd.DataFrame(), "No results found in the data."
-    else:
-        return None, f"Failed to retrieve data: {response.status_code}"
+    df, error = get_client().get_aggregates(ticker, start_date)
+    if error is None:
+        print(f"Retrieved historical data for {ticker}: {df.head()}")
+    return df, error
 
 def get_stock_price(symbol, start_date, end_date):
-    stock = yf.Ticker(symbol)
-    hist = stock.history(start=start_date, end=end_date)
-    hist.reset_index(inplace=True)
+    hist = get_bar_store().history(symbol, start_date, end_date)
     hist['date'] = hist['Date'].dt.date
     hist.rename(columns={'Close': 'stock_close_price'}, inplace=True)
     hist['stock'] = hist['stock_close_price'].round(2)
@@ -63,13 +57,8 @@ def get_stock_price(symbol, start_date, end_date):
 
 
 def get_ticker(strike, symbol, maturity):
-    strike = f'{strike:09.3f}'
-    strike = strike.replace('.', '')
-
-    maturity = maturity.replace('-', '')
-    maturity = maturity[2:]
-
-    return f"{symbol}{maturity}C{strike}", f"{symbol}{maturity}P{strike}"
+    # OCC call and put symbols, Polygon's "O:" is added by the callers
+    return option_pair(symbol, maturity, strike)
 
 def get_pnl(call_ticker, put_ticker, trade_date, stock_trade_price, effective_delta, call_action, NC, C_0, put_action, NP, P_0):
     pnl_data = data(call_ticker, put_ticker, trade_date)
@@ -81,12 +70,13 @@ def get_pnl(call_ticker, put_ticker, trade_date, stock_trade_price, effective_de
     return pnl_data
 
 def data(call_ticker, put_ticker, trade_date):
-    call_data, call_error = get_historical_data(call_ticker, trade_date)
+    # both legs are requested at once over the shared client
+    (call_data, call_error), (put_data, put_error) = get_client().fetch_many([f'O:{call_ticker}', f'O:{put_ticker}'], trade_date)
+
     if call_error:
         print(call_error)
         return pd.DataFrame()
 
-    put_data, put_error = get_historical_data(put_ticker, trade_date)
     if put_error:
         print(put_error)
         return pd.DataFrame()
@@ -100,12 +90,73 @@ def data(call_ticker, put_ticker, trade_date):
     
     data = pd.merge(call_data, put_data, on='date', how='inner')
     
-    symbol = call_ticker[:next((i for i, char in enumerate(call_ticker) if char.isdigit()), None)]
-    length = len(symbol)
-    date = call_ticker[length:length + 6]
-    expire_date = f"20{date[:2]}-{date[2:4]}-{date[4:]}"
-    stock_data = get_stock_price(symbol, trade_date, expire_date)
+    contract = parse_symbol(call_ticker)
+    stock_data = get_stock_price(contract.root, trade_date, f"{contract.expiration:%Y-%m-%d}")
 
     data = pd.merge(data, stock_data, on='date', how='inner')
     
     return data
+
+# Columns that identify one mark of one position, adding a trade twice removes it
+TRADE_KEYS = ['trade_date', 'symbol', 'strike', 'expiration', 'stock_trade_price', 'effective_delta',
+              'delta_source', 'call_trade_price', 'call_action_type', 'num_call_contracts', 'put_trade_price',
+              'put_action_type', 'num_put_contracts']
+
+@timed('compute')
+def trades_from_marks(marks, symbol, strike, expiration, stock_trade_price, effective_delta,
+                      call_action_type, num_call_contracts, put_action_type, num_put_contracts, resolution='1D'):
+    # marks are rows of option_data, P&L is computed for all of them at once
+    call_trade_price = (marks['call_ask'] if call_action_type == 'buy' else marks['call_bid']).to_numpy(dtype=float)
+    put_trade_price = (marks['put_ask'] if put_action_type == 'buy' else marks['put_bid']).to_numpy(dtype=float)
+    stock = marks['stock'].to_numpy(dtype=float)
+    # effective_delta is a constant or one value per mark (tools.effective_delta); a series
+    # rebalances the hedge at every mark, keeps its entry value and is marked as a model position
+    delta_source = 'input' if np.ndim(effective_delta) == 0 else 'model'
+    hedge_delta = np.broadcast_to(np.asarray(effective_delta, dtype=float), stock.shape)
+    daily_pnl = calculate_pnl(call_action_type, put_action_type,
+                              num_call_contracts, call_trade_price, call_trade_price,
+                              num_put_contracts, put_trade_price, put_trade_price,
+                              effective_delta if np.ndim(effective_delta) == 0 else 0.0, stock_trade_price, stock)
+    if np.ndim(effective_delta) > 0:
+        daily_pnl = daily_pnl + rebalanced_hedge_pnl(hedge_delta, stock_trade_price, stock)
+        effective_delta = entry_delta(hedge_delta)
+    daily_pnl = np.round(daily_pnl, 2)
+    investment = ((num_call_contracts * call_trade_price) + (num_put_contracts * put_trade_price)) * 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change = np.round(daily_pnl / investment * 100, 2)
+
+    return apply_schema(pd.DataFrame({
+        'trade_date': marks['timestamp'].to_numpy(),
+        'symbol': symbol,
+        'strike': strike,
+        'expiration': expiration,
+        'stock_trade_price': stock_trade_price,
+        'effective_delta': effective_delta,
+        'delta_source': delta_source,
+        'call_trade_price': call_trade_price,
+        'call_action_type': call_action_type,
+        'num_call_contracts': num_call_contracts,
+        'put_trade_price': put_trade_price,
+        'put_action_type': put_action_type,
+        'num_put_contracts': num_put_contracts,
+        'stock_close_price': np.round(stock, 2),
+        'call_close_price': marks['call_last'].to_numpy(),
+        'put_close_price': marks['put_last'].to_numpy(),
+        'daily_pnl': daily_pnl,
+        'change': change,
+        'resolution': resolution,
+        'hedge_delta': hedge_delta,
+    }), TRADE_SCHEMA)
+
+@timed('compute')
+def merge_trades(trades, new_trades):
+    # rows already present are dropped together with their duplicate, the rest are appended
+    if trades.empty:
+        return new_trades.reset_index(drop=True)
+    old_keys = pd.MultiIndex.from_frame(trades[TRADE_KEYS])
+    new_keys = pd.MultiIndex.from_frame(new_trades[TRADE_KEYS])
+    duplicate = old_keys.isin(new_keys)
+    if duplicate.any():
+        print(f"{int(duplicate.sum())} trade row(s) already exist. Skipping duplicate entries.")
+    # categories differ between books, concat falls back to object and the schema restores them
+    return apply_schema(pd.concat([trades[~duplicate], new_trades[~new_keys.isin(old_keys)]], ignore_index=True), TRADE_SCHEMA)
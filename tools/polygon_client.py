@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import pandas as pd
+
+from tools.response_cache import get_cache
+from tools.single_flight import get_flight
+from tools.instrument import stage, count
+
+API_KEY = os.environ.get('POLYGON_API_KEY', 'C6ig1sXku2yKl_XEIvSvc_OWCwB8ILLn')
+BASE_URL = 'https://api.polygon.io'
+# The free plan allows 5 requests a minute, paid plans are effectively unlimited
+CALLS_PER_MINUTE = float(os.environ.get('POLYGON_CALLS_PER_MINUTE', '5'))
+
+
+class TokenBucket:
+    '''
+    Blocking token bucket, `rate` tokens per second up to `capacity` banked.
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PolygonClient:
+    '''
+    One keep-alive session for every Polygon call, throttled to the plan's quota.
+    fetch_many runs up to `max_workers` tickers at a time, the bucket still caps the request rate.
+    '''
+    def __init__(self, api_key=API_KEY, calls_per_minute=CALLS_PER_MINUTE, max_workers=4, max_retries=3, cache=None):
+        self.api_key = api_key
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.limiter = TokenBucket(calls_per_minute / 60.0, max(1.0, min(calls_per_minute, max_workers)))
+        self.cache = cache or get_cache()
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, params=None):
+        params = dict(params or {})
+        params.setdefault('apiKey', self.api_key)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            response = self.session.get(url, params=params, timeout=30)
+            if response.status_code != 429 or attempt == self.max_retries:
+                return response
+            # over quota, wait as long as the server asks before trying again
+            wait = float(response.headers.get('Retry-After', 60.0 / max(CALLS_PER_MINUTE, 1)))
+            print(f"Polygon rate limit hit, retrying in {wait:.0f}s.")
+            time.sleep(wait)
+        return response
+
+    def iter_pages(self, url, params=None):
+        '''
+        Yield (status_code, payload) for each page, following next_url until it runs out.
+        '''
+        while url:
+            response = self.get(url, params)
+            if response.status_code != 200:
+                yield response.status_code, None
+                return
+            payload = response.json()
+            yield response.status_code, payload
+            # next_url already carries the query, only the key has to be added again
+            url, params = payload.get('next_url'), None
+
+    def get_aggregates(self, ticker, start_date, end_date=None, multiplier=1, timespan='day'):
+        '''
+        Daily (or other timespan) aggregates as a DataFrame with date and c columns, plus an error message or None.
+        '''
+        end_date = end_date or datetime.now()
+        if isinstance(start_date, datetime):
+            start_date = start_date.strftime('%Y-%m-%d')
+        if isinstance(end_date, datetime):
+            end_date = end_date.strftime('%Y-%m-%d')
+
+        def fetch(start, end):
+            url = f"{BASE_URL}/v2/aggs/ticker/{ticker}/range/{multiplier}/{timespan}/{start}/{end}"
+            results = []
+            with stage('fetch', f'polygon {ticker}'):
+                for status, payload in self.iter_pages(url, {'limit': 50000}):
+                    if payload is None:
+                        return None, f"Failed to retrieve data: {status}"
+                    results.extend(payload.get('results', []))
+            count('polygon_rows', len(results))
+            return results, None
+
+        # past sessions come from the on-disk cache, only the missing tail goes to Polygon
+        day_of = lambda row: datetime.fromtimestamp(row['t'] / 1000, timezone.utc).strftime('%Y-%m-%d')
+        # identical requests from other threads join the one already in flight
+        resolution = f'{multiplier}{timespan}'
+        results, error = get_flight('aggregates').do((ticker, resolution, str(start_date), str(end_date)),
+                                                     self.cache.get_range, ticker, resolution, start_date, end_date, fetch, day_of)
+        if error is not None:
+            return None, error
+
+        if not results:
+            return pd.DataFrame(), "No results found in the data."
+        with stage('decode', f'polygon {ticker}'):
+            df = pd.DataFrame(results)
+            df['t'] = pd.to_datetime(df['t'], unit='ms')
+            df['date'] = df['t'].dt.date
+        return df[['date', 'c']], None
+
+    def fetch_many(self, tickers, start_date, end_date=None, **kwargs):
+        # results come back in the order of `tickers`
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.get_aggregates, ticker, start_date, end_date, **kwargs) for ticker in tickers]
+            return [future.result() for future in futures]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PolygonClient()
+    return _client
@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+import numpy as np
+import pandas as pd
+
+from tools.instrument import stage
+from tools.trading_calendar import get_calendar, last_closed_session, session_date
+
+STORE_DIR = os.environ.get('PNL_BAR_STORE', os.path.join('cache', 'bars'))
+# Today's bar is still moving, it is kept in memory only and refetched after this many seconds
+LIVE_BAR_TTL = float(os.environ.get('PNL_LIVE_BAR_TTL', '60'))
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+
+
+def to_day(value):
+    return np.datetime64(pd.Timestamp(value).strftime('%Y-%m-%d'), 'D')
+
+
+class BarStore:
+    '''
+    Daily bars per symbol kept as arrays in <root>/<symbol>.npz.
+    Closed sessions are written once: an update only asks Yahoo for days after the
+    high-water mark (and, once, for anything older than the first stored day).
+    Closes are unadjusted so stored sessions never need rewriting after a dividend.
+    '''
+    def __init__(self, root=STORE_DIR, live_ttl=LIVE_BAR_TTL):
+        self.root = root
+        self.live_ttl = live_ttl
+        self.series = {}
+        self.live = {}
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.hits = 0
+
+    def path(self, symbol):
+        return os.path.join(self.root, f"{symbol.replace('^', '_')}.npz")
+
+    def load(self, symbol):
+        if symbol not in self.series:
+            path = self.path(symbol)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    self.series[symbol] = {key: data[key] for key in data.files}
+            else:
+                self.series[symbol] = None
+        return self.series[symbol]
+
+    def save(self, symbol, series):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path(symbol) + '.tmp.npz'
+        np.savez(tmp, **series)
+        os.replace(tmp, self.path(symbol))
+        self.series[symbol] = series
+
+    def download(self, symbol, start, end):
+        # bars for [start, end] as arrays, end inclusive
+        import yfinance as yf
+        with stage('fetch', f'yfinance bars {symbol}'):
+            hist = yf.Ticker(symbol).history(start=str(start), end=str(end + 1), auto_adjust=False)
+        self.downloads += 1
+        if hist.empty:
+            return {'date': np.array([], dtype='datetime64[D]'), **{f: np.array([], dtype=float) for f in FIELDS}}
+        days = hist.index.tz_localize(None).values.astype('datetime64[D]') if hist.index.tz else hist.index.values.astype('datetime64[D]')
+        return {'date': days, **{f: hist[f.capitalize()].to_numpy(dtype=float) for f in FIELDS}}
+
+    def update(self, symbol, start, end):
+        '''
+        Make sure closed sessions in [start, end] are stored, fetching only what is not there yet.
+        '''
+        today = to_day(session_date())
+        last_closed = min(get_calendar().previous_session(end), last_closed_session())
+        series = self.load(symbol)
+
+        # [since, checked] is the span already asked of Yahoo; checked only moves up to the last
+        # session that came back with a bar, so an empty or failed download is asked again
+        pieces = []
+        if series is None:
+            since, checked = start, start - 1
+        else:
+            since, checked = series['since'][()], series['checked'][()]
+            if start < since:
+                pieces.append(self.download(symbol, start, since - 1))
+            pieces.append({k: series[k] for k in ['date'] + FIELDS})
+            since = min(since, start)
+        if checked < last_closed:
+            fresh = self.download(symbol, checked + 1, last_closed)
+            pieces.append(fresh)
+            closed = fresh['date'][fresh['date'] < today]
+            if len(closed):
+                checked = max(checked, closed.max())
+
+        if series is not None and len(pieces) == 1:
+            self.hits += 1
+            return series
+        merged = {k: np.concatenate([p[k] for p in pieces]) if pieces else np.array([], dtype=float)
+                  for k in ['date'] + FIELDS}
+        # sorted, one bar per day, and never today's unfinished session
+        days, first = np.unique(merged['date'].astype('datetime64[D]'), return_index=True)
+        keep = days < today
+        merged = {k: merged[k][first][keep] for k in FIELDS}
+        merged['date'] = days[keep]
+        merged['since'] = np.array(since)
+        merged['checked'] = np.array(checked)
+        self.save(symbol, merged)
+        return merged
+
+    def live_bar(self, symbol, today):
+        entry = self.live.get(symbol)
+        if entry is None or time.monotonic() - entry[0] >= self.live_ttl:
+            entry = (time.monotonic(), self.download(symbol, today, today))
+            self.live[symbol] = entry
+        return entry[1]
+
+    def read(self, symbol, start, end):
+        '''
+        Bars with start <= date <= end as a dict of arrays (date, open, high, low, close, volume).
+        '''
+        start, end = to_day(start), to_day(end)
+        today = to_day(session_date())
+        with self.lock:
+            series = self.update(symbol, start, end)
+            lo = np.searchsorted(series['date'], start, side='left')
+            hi = np.searchsorted(series['date'], end, side='right')
+            out = {k: series[k][lo:hi] for k in ['date'] + FIELDS}
+            if start <= today <= end:
+                live = self.live_bar(symbol, today)
+                out = {k: np.concatenate([out[k], live[k]]) for k in out}
+        return out
+
+    def history(self, symbol, start_date, end_date):
+        '''
+        Drop-in for yf.Ticker(symbol).history(start, end).reset_index(): a Date/Open/High/Low/Close/Volume frame.
+        end_date is exclusive unless it carries a time of day, like history() itself.
+        '''
+        end_date = pd.Timestamp(end_date)
+        last_date = end_date.normalize() if end_date != end_date.normalize() else end_date - pd.Timedelta(days=1)
+        if last_date < pd.Timestamp(start_date).normalize():
+            return pd.DataFrame(columns=['Date'] + [f.capitalize() for f in FIELDS])
+        bars = self.read(symbol, start_date, last_date)
+        hist = pd.DataFrame({f.capitalize(): bars[f] for f in FIELDS})
+        hist.insert(0, 'Date', pd.to_datetime(bars['date']))
+        return hist
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_bar_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = BarStore()
+    return _store
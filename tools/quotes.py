@@ -0,0 +1,104 @@
+import os
+import time
+import threading
+
+from tools.single_flight import get_flight
+from tools.instrument import stage
+
+# Quotes are reused for this many seconds, every caller in that window shares one download
+QUOTE_TTL = float(os.environ.get('PNL_QUOTE_TTL', '5'))
+
+
+def parse_quotes(data, symbols):
+    '''
+    Last price, change and percent change per symbol from a yf.download daily frame.
+    The last bar's close is the live price during the session, the bar before it is the previous close.
+    '''
+    quotes = {}
+    for symbol in symbols:
+        try:
+            closes = data[symbol]['Close'] if symbol in data.columns.get_level_values(0) else data['Close']
+        except KeyError:
+            continue
+        closes = closes.dropna()
+        if closes.empty:
+            continue
+        current_price = float(closes.iloc[-1])
+        previous_close = float(closes.iloc[-2]) if len(closes) > 1 else current_price
+        price_change = current_price - previous_close
+        percent_change = round((price_change / previous_close) * 100, 2) if previous_close else 0.0
+        quotes[symbol] = (current_price, price_change, percent_change)
+    return quotes
+
+
+class QuoteService:
+    '''
+    Underlying quotes for a whole watchlist from one batched Yahoo request per refresh interval.
+    '''
+    def __init__(self, ttl=QUOTE_TTL):
+        self.ttl = ttl
+        self.watchlist = set()
+        self.quotes = {}
+        self.fetched_symbols = set()
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+
+    def watch(self, symbols):
+        with self.lock:
+            self.watchlist.update(symbols)
+
+    def fetch(self, symbols):
+        import yfinance as yf
+        with stage('fetch', 'yfinance quotes'):
+            data = yf.download(sorted(symbols), period='5d', interval='1d', group_by='ticker',
+                               auto_adjust=False, progress=False, threads=False)
+        self.requests += 1
+        with stage('decode', 'yfinance quotes'):
+            return parse_quotes(data, symbols)
+
+    def snapshot(self, symbols=()):
+        '''
+        Quotes for `symbols` and everything watched, refreshed together once any of them is stale or missing.
+        '''
+        symbols = set(symbols)
+        with self.lock:
+            self.watchlist.update(symbols)
+            stale = time.monotonic() - self.fetched_at >= self.ttl
+            if not stale and symbols.issubset(self.fetched_symbols):
+                self.hits += 1
+                return self.pick(symbols)
+            watchlist = frozenset(self.watchlist)
+        try:
+            # callers that go stale together share one download of the same watchlist
+            get_flight('quotes').do(watchlist, self.refresh, watchlist)
+        except Exception as e:
+            print(f"Error retrieving stock data: {e}")
+            return {}
+        with self.lock:
+            return self.pick(symbols)
+
+    def refresh(self, watchlist):
+        quotes = self.fetch(watchlist)
+        with self.lock:
+            self.quotes = quotes
+            self.fetched_symbols = set(watchlist)
+            self.fetched_at = time.monotonic()
+
+    def pick(self, symbols):
+        return {symbol: self.quotes[symbol] for symbol in symbols if symbol in self.quotes} if symbols else dict(self.quotes)
+
+    def quote(self, symbol):
+        return self.snapshot([symbol]).get(symbol)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_quote_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = QuoteService()
+    return _service
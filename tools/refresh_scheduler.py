@@ -0,0 +1,51 @@
+import os
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from tools.pnl_tools import market_open
+
+# Poll interval in seconds while the market is open, doubled after every refresh that changed nothing
+OPEN_INTERVAL = float(os.environ.get('PNL_REFRESH_OPEN', '5'))
+MAX_OPEN_INTERVAL = float(os.environ.get('PNL_REFRESH_MAX_OPEN', '60'))
+# Outside market hours quotes only move on a data correction
+CLOSED_INTERVAL = float(os.environ.get('PNL_REFRESH_CLOSED', '300'))
+
+
+class RefreshScheduler(QObject):
+    '''
+    Single-shot timer that emits `due` when the next refresh should start.
+    The owner reports each finished refresh with done(changed); the next one is
+    only scheduled then, so refreshes never overlap.
+    '''
+    due = pyqtSignal()
+
+    def __init__(self, parent=None, open_interval=OPEN_INTERVAL, max_open_interval=MAX_OPEN_INTERVAL,
+                 closed_interval=CLOSED_INTERVAL, is_open=market_open):
+        super().__init__(parent)
+        self.open_interval = open_interval
+        self.max_open_interval = max_open_interval
+        self.closed_interval = closed_interval
+        self.is_open = is_open
+        self.unchanged = 0
+        self.active = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.due)
+
+    def interval(self):
+        if not self.is_open():
+            return self.closed_interval
+        return min(self.open_interval * 2 ** self.unchanged, self.max_open_interval)
+
+    def start(self):
+        self.active = True
+        self.unchanged = 0
+        self.timer.start(0)
+
+    def stop(self):
+        self.active = False
+        self.timer.stop()
+
+    def done(self, changed):
+        self.unchanged = 0 if changed else self.unchanged + 1
+        if self.active:
+            self.timer.start(int(self.interval() * 1000))
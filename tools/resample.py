@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+# Resolutions offered by the P&L apps, '1D' keeps the original one-mark-per-day path
+RESOLUTIONS = ['1D', '5min', '1min', '30s', '10s', '1s']
+
+SESSION_OPEN = pd.Timedelta(hours=9, minutes=30)
+SESSION_CLOSE = pd.Timedelta(hours=16)
+
+
+def is_intraday(resolution):
+    return bool(resolution) and pd.Timedelta(resolution) < pd.Timedelta('1D')
+
+def resample_ticks(ticks, resolution):
+    '''
+    Collapse a tick stream (Timestamp, Last, Bid, Ask) to one mark per bucket.
+    Buckets are right-closed, a mark stamped t carries the last tick seen in (t - resolution, t].
+    '''
+    columns = ['Timestamp', 'Last', 'Bid', 'Ask']
+    if ticks is None or ticks.empty:
+        return pd.DataFrame(columns=columns)
+
+    ts = ticks['Timestamp'].values.astype('datetime64[ns]').view('i8')
+    order = np.argsort(ts, kind='stable')
+    ts = ts[order]
+    step = pd.Timedelta(resolution).value
+    bucket = -(-ts // step)
+
+    # the last tick of each bucket is where the bucket id changes
+    last = np.flatnonzero(np.r_[bucket[1:] != bucket[:-1], True])
+    rows = order[last]
+
+    marks = pd.DataFrame({'Timestamp': pd.to_datetime(bucket[last] * step)})
+    for col in columns[1:]:
+        marks[col] = ticks[col].values[rows]
+    return marks
+
+def session_grid(days, resolution):
+    '''
+    Every bucket stamp from the open (exclusive) to the close (inclusive) for each day, as one array.
+    '''
+    step = pd.Timedelta(resolution).value
+    n = (SESSION_CLOSE - SESSION_OPEN).value // step
+    offsets = SESSION_OPEN.value + step * np.arange(1, n + 1, dtype='i8')
+    days = pd.to_datetime(pd.Series(days)).dt.normalize().drop_duplicates().sort_values()
+    starts = days.values.astype('datetime64[ns]').view('i8')
+    grid = (starts[:, None] + offsets[None, :]).ravel()
+    return pd.DataFrame({'Timestamp': pd.to_datetime(grid)})
+
+def asof_join(left, right, prefix=None, columns=None):
+    '''
+    Attach to each row of `left` the latest row of `right` at or before its Timestamp.
+    '''
+    columns = columns or [c for c in right.columns if c != 'Timestamp']
+    right = right[['Timestamp'] + columns]
+    if prefix:
+        right = right.rename(columns={c: f"{prefix} {c}" for c in columns})
+    if right.empty:
+        out = left.copy()
+        for col in right.columns[1:]:
+            out[col] = np.nan
+        return out
+    return pd.merge_asof(left.sort_values('Timestamp'), right.sort_values('Timestamp'),
+                         on='Timestamp', direction='backward')
+
+def intraday_marks(begin_date, end_date, call_symbol, put_symbol, underlying_symbol, resolution, provider):
+    '''
+    Call, put and underlying marks every `resolution` through each session, in the same
+    layout HisPnl.main returns for daily marks. Legs and underlying are aligned by as-of joins,
+    so a quiet contract carries its last quote forward instead of dropping the bucket.
+    '''
+    call = resample_ticks(provider.get_ticks(call_symbol, begin_date, end_date), resolution)
+    put = resample_ticks(provider.get_ticks(put_symbol, begin_date, end_date), resolution)
+    stock = resample_ticks(provider.get_ticks(underlying_symbol, begin_date, end_date), resolution)
+
+    days = pd.concat([call['Timestamp'], put['Timestamp'], stock['Timestamp']])
+    if days.empty:
+        return pd.DataFrame()
+    grid = session_grid(days, resolution)
+    grid = grid[(grid['Timestamp'] > pd.Timestamp(begin_date)) & (grid['Timestamp'] <= pd.Timestamp(end_date))]
+
+    df = asof_join(grid, call, 'Call', ['Last', 'Bid', 'Ask'])
+    df = asof_join(df, put, 'Put', ['Last', 'Bid', 'Ask'])
+    df = asof_join(df, stock.rename(columns={'Last': 'Stock'}), columns=['Stock'])
+    # nothing to mark before the first quote of either leg
+    df = df.dropna(subset=['Call Last', 'Put Last'], how='all').reset_index(drop=True)
+
+    df['Call Option'] = call_symbol
+    df['Put Option'] = put_symbol
+    return df[['Timestamp', 'Call Last', 'Call Bid', 'Call Ask', 'Call Option',
+               'Put Last', 'Put Bid', 'Put Ask', 'Put Option', 'Stock']]
+
+def decimate(values, max_points):
+    '''
+    Indices of at most ~max_points samples that keep the min and max of every bucket,
+    so a decimated line still shows each intraday swing.
+    '''
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    edges = np.linspace(0, n, buckets + 1).astype(int)
+    values = np.asarray(values, dtype=float)
+    keep = [0, n - 1]
+    starts = edges[:-1]
+    # reduceat gives per-bucket extremes in one pass, argmin/argmax locate them
+    mins = np.minimum.reduceat(values, starts)
+    maxs = np.maximum.reduceat(values, starts)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    is_min = values == mins[bucket_of]
+    is_max = values == maxs[bucket_of]
+    first_min = np.unique(bucket_of[is_min], return_index=True)[1]
+    first_max = np.unique(bucket_of[is_max], return_index=True)[1]
+    keep.extend(np.flatnonzero(is_min)[first_min])
+    keep.extend(np.flatnonzero(is_max)[first_max])
+    return np.unique(np.asarray(keep))
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime, date
+import pandas as pd
+
+import numpy as np
+
+from tools.trading_calendar import get_calendar, session_date
+
+CACHE_PATH = os.environ.get('PNL_CACHE_DB', os.path.join('cache', 'responses.db'))
+# Bars of the current session can still change, they are reused for this long
+TODAY_TTL = float(os.environ.get('PNL_CACHE_TODAY_TTL', '60'))
+# A past day that came back empty (a holiday, or data the provider had not published yet) is asked again after this long
+EMPTY_TTL = float(os.environ.get('PNL_CACHE_EMPTY_TTL', '3600'))
+
+
+def as_date_str(value):
+    if isinstance(value, (datetime, date, pd.Timestamp)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def session_days(start, end):
+    # YYYY-MM-DD of the NYSE sessions in [start, end], the only days a response can have rows for
+    return set(np.datetime_as_string(get_calendar(start, end).sessions_in_range(start, end), unit='D'))
+
+
+class ResponseCache:
+    '''
+    Rows of historical responses stored per (ticker, resolution, date).
+    A day before today (the US/Eastern date) is final once fetched with rows, a past session that
+    came back empty expires after EMPTY_TTL and today expires after TODAY_TTL. Days without a
+    session (weekends, holidays) are final and never count as missing.
+    '''
+    def __init__(self, path=CACHE_PATH, today_ttl=TODAY_TTL, empty_ttl=EMPTY_TTL):
+        self.path = path
+        self.today_ttl = today_ttl
+        self.empty_ttl = empty_ttl
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                ticker TEXT,
+                resolution TEXT,
+                date TEXT,
+                payload TEXT,
+                fetched_at REAL,
+                final INTEGER,
+                PRIMARY KEY (ticker, resolution, date)
+            )
+        ''')
+        self.conn.commit()
+
+    def cached_days(self, ticker, resolution, start, end):
+        now = time.time()
+        today = session_date()
+        sessions = session_days(start, end)
+        with self.lock:
+            rows = self.conn.execute('''
+                SELECT date, payload, fetched_at, final FROM responses
+                WHERE ticker = ? AND resolution = ? AND date BETWEEN ? AND ?
+            ''', (ticker, resolution, start, end)).fetchall()
+        fresh = {}
+        for day, payload, fetched_at, final in rows:
+            rows_of_day = json.loads(payload)
+            ttl = self.empty_ttl if day < today and not rows_of_day else self.today_ttl
+            # empty sessions stored as final by earlier versions expire too
+            if (final and (rows_of_day or day not in sessions)) or now - fetched_at < ttl:
+                fresh[day] = rows_of_day
+        return fresh
+
+    def store_days(self, ticker, resolution, days, rows_by_day):
+        today = session_date()
+        sessions = session_days(min(days), max(days)) if days else set()
+        now = time.time()
+        with self.lock:
+            self.conn.executemany('''
+                INSERT OR REPLACE INTO responses (ticker, resolution, date, payload, fetched_at, final)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', [(ticker, resolution, day, json.dumps(rows_by_day.get(day, [])), now,
+                   int(day < today and (bool(rows_by_day.get(day)) or day not in sessions)))
+                  for day in days])
+            self.conn.commit()
+
+    def get_range(self, ticker, resolution, start, end, fetch, day_of):
+        '''
+        Rows for every day in [start, end]. Sessions missing from the cache are fetched with a
+        single fetch(first_missing_session, end) call and stitched onto the cached ones.
+        `day_of(row)` gives the YYYY-MM-DD a fetched row belongs to.
+        '''
+        start, end = as_date_str(start), as_date_str(end)
+        days = pd.date_range(start, end).strftime('%Y-%m-%d').tolist()
+        cached = self.cached_days(ticker, resolution, start, end)
+        sessions = session_days(start, end)
+        missing = [day for day in days if day in sessions and day not in cached]
+
+        if missing:
+            rows, error = fetch(missing[0], end)
+            if error is not None:
+                return None, error
+            rows_by_day = {}
+            for row in rows:
+                rows_by_day.setdefault(day_of(row), []).append(row)
+            tail = days[days.index(missing[0]):]
+            self.store_days(ticker, resolution, tail, rows_by_day)
+            for day in tail:
+                cached[day] = rows_by_day.get(day, [])
+
+        return [row for day in days for row in cached.get(day, [])], None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,220 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from tools.greeks import RiskEngine, book_legs, blsimpv, blsprice, years_to_expiry
+from tools.price_store import get_bar_store
+from tools.trading_calendar import TRADING_DAYS_PER_YEAR
+from tools.instrument import timed, count
+from tools.symbology import INDEX_ROOTS, listed_root
+
+# Scenarios revalued per block, a block is scenarios x legs float64 arrays
+BLOCK_CELLS = int(os.environ.get('PNL_SCENARIO_BLOCK', str(2_000_000)))
+WORKERS = int(os.environ.get('PNL_SCENARIO_WORKERS', str(min(8, os.cpu_count() or 1))))
+
+# Relative spot move and absolute vol shift, '*' applies to every underlying without its own entry
+STRESS_TESTS = [
+    {'name': 'crash -20%, vol +15', 'spot': {'*': -0.20}, 'vol': {'*': 0.15}},
+    {'name': 'selloff -10%, vol +8', 'spot': {'*': -0.10}, 'vol': {'*': 0.08}},
+    {'name': 'drop -5%, vol +4', 'spot': {'*': -0.05}, 'vol': {'*': 0.04}},
+    {'name': 'vol crush -10', 'spot': {'*': 0.0}, 'vol': {'*': -0.10}},
+    {'name': 'rally +5%, vol -3', 'spot': {'*': 0.05}, 'vol': {'*': -0.03}},
+    {'name': 'melt-up +10%, vol -5', 'spot': {'*': 0.10}, 'vol': {'*': -0.05}},
+]
+
+
+class Scenarios:
+    '''
+    S scenarios over U underlyings: relative spot moves and absolute vol shifts, both S x U.
+    '''
+    def __init__(self, names, underlyings, spot_moves, vol_shifts=None, horizon_days=1):
+        self.names = list(names)
+        self.underlyings = np.asarray(underlyings, dtype=str)
+        self.spot_moves = np.asarray(spot_moves, dtype=float).reshape(len(self.names), len(self.underlyings))
+        self.vol_shifts = np.zeros_like(self.spot_moves) if vol_shifts is None else \
+            np.asarray(vol_shifts, dtype=float).reshape(self.spot_moves.shape)
+        self.horizon_days = horizon_days
+
+    def __len__(self):
+        return len(self.names)
+
+    def align(self, underlyings):
+        # columns in the order of `underlyings`, no move for an underlying the scenarios lack
+        idx = {name: i for i, name in enumerate(self.underlyings)}
+        spot = np.zeros((len(self), len(underlyings)))
+        vol = np.zeros((len(self), len(underlyings)))
+        for j, name in enumerate(underlyings):
+            if name in idx:
+                spot[:, j] = self.spot_moves[:, idx[name]]
+                vol[:, j] = self.vol_shifts[:, idx[name]]
+        return spot, vol
+
+
+def stress_scenarios(underlyings, tests=STRESS_TESTS):
+    spot = np.array([[test.get('spot', {}).get(u, test.get('spot', {}).get('*', 0.0)) for u in underlyings] for test in tests])
+    vol = np.array([[test.get('vol', {}).get(u, test.get('vol', {}).get('*', 0.0)) for u in underlyings] for test in tests])
+    return Scenarios([test['name'] for test in tests], underlyings, spot, vol, horizon_days=0)
+
+
+def spot_history(underlyings, start, end, store=None):
+    '''
+    Daily closes (sessions x underlyings) from the bar store, sessions missing for a symbol stay NaN.
+    '''
+    store = store or get_bar_store()
+    closes = {}
+    for symbol in underlyings:
+        bars = store.read(symbol, start, end)
+        closes[symbol] = pd.Series(bars['close'], index=pd.to_datetime(bars['date']))
+    return pd.DataFrame(closes, columns=list(underlyings)).sort_index()
+
+
+def stored_roots(underlying, expiry, roots=None):
+    # option roots the marks of an underlying may be stored under: the given one, else the
+    # ticker itself and its listed roots (^SPX marks are stored as SPX or SPXW)
+    if roots and underlying in roots:
+        return [roots[underlying]]
+    return list(dict.fromkeys([underlying, *INDEX_ROOTS.get(underlying, ()), listed_root(underlying, expiry)]))
+
+
+def vol_history(conn, engine, start, end, roots=None):
+    '''
+    Daily implied vol per underlying (sessions x underlyings) from the 1D marks in option_data:
+    the vol of every option leg in the book is solved on every stored day and the median over
+    an underlying's legs is taken. `roots` maps an underlying to its option root when it differs
+    (^SPX: SPXW). Underlyings without stored marks are left out, with a warning.
+    '''
+    from realPrice.HisPnl import get_symbol
+    legs = engine.legs[engine.option]
+    if legs.empty:
+        return pd.DataFrame()
+    contracts = {}
+    for (underlying, strike, expiry, kind), _ in legs.groupby(['underlying', 'strike', 'expiry', 'kind'], sort=False):
+        for root in stored_roots(underlying, pd.Timestamp(expiry), roots):
+            call, put = get_symbol(root, strike, f"{pd.Timestamp(expiry):%Y-%m-%d}")
+            contracts[call if kind == 'call' else put] = (underlying, strike, expiry, kind)
+
+    names = list(contracts)
+    placeholders = ', '.join('?' * len(names))
+    rows = []
+    for side in ('call', 'put'):
+        cursor = conn.execute(f'''
+            SELECT timestamp, {side}_option, {side}_last, stock FROM option_data
+            WHERE resolution = '1D' AND timestamp BETWEEN ? AND ? AND {side}_option IN ({placeholders})
+        ''', (str(start), f"{end} 23:59:59", *names))
+        rows += cursor.fetchall()
+    marks = pd.DataFrame(rows, columns=['timestamp', 'contract', 'last', 'stock']).drop_duplicates(['timestamp', 'contract'])
+    found = {contracts[c][0] for c in marks['contract']}
+    for underlying in dict.fromkeys(legs['underlying']):
+        if underlying not in found:
+            print(f"No stored 1D marks for {underlying} options between {start} and {end}, its vols are held constant.")
+    if marks.empty:
+        return pd.DataFrame()
+    info = pd.DataFrame([contracts[c] for c in marks['contract']], columns=['underlying', 'strike', 'expiry', 'kind'])
+    moments = pd.to_datetime(marks['timestamp'], format='ISO8601') + pd.Timedelta(hours=16)
+    T = years_to_expiry(info['expiry'], moments)
+    marks['vol'] = blsimpv(np.where(info['kind'] == 'call', 'c', 'p'), marks['stock'].to_numpy(dtype=float),
+                           info['strike'].to_numpy(dtype=float), T, engine.r, marks['last'].to_numpy(dtype=float))
+    marks['underlying'] = info['underlying'].to_numpy()
+    marks['date'] = moments.dt.normalize()
+    return marks.pivot_table(index='date', columns='underlying', values='vol', aggfunc='median').sort_index()
+
+
+def historical_scenarios(underlyings, start, end, conn=None, engine=None, horizon_days=1, store=None, roots=None):
+    '''
+    One scenario per session: the horizon's close-to-close move of every underlying and, when the
+    book's marks are stored in `conn`, the change in implied vol over the same days (see vol_history).
+    '''
+    closes = spot_history(underlyings, start, end, store)
+    moves = (closes / closes.shift(horizon_days) - 1).iloc[horizon_days:]
+    shifts = pd.DataFrame(0.0, index=moves.index, columns=moves.columns)
+    if conn is not None and engine is not None:
+        vols = vol_history(conn, engine, start, end, roots).reindex(closes.index).ffill()
+        if not vols.empty:
+            changes = (vols - vols.shift(horizon_days)).reindex(moves.index)
+            shifts.update(changes)
+    moves = moves.dropna(how='all')
+    shifts = shifts.reindex(moves.index).fillna(0.0)
+    names = [f"{day:%Y-%m-%d}" for day in moves.index]
+    return Scenarios(names, list(moves.columns), moves.fillna(0.0).to_numpy(), shifts.to_numpy(), horizon_days)
+
+
+def value_at_risk(pnl, confidence=0.99):
+    '''
+    (VaR, ES) as positive losses at `confidence` from a P&L sample.
+    '''
+    pnl = np.sort(np.asarray(pnl, dtype=float))
+    if not len(pnl):
+        return 0.0, 0.0
+    tail = max(int(np.floor(len(pnl) * (1 - confidence))), 1)
+    var = -np.quantile(pnl, 1 - confidence)
+    es = -pnl[:tail].mean()
+    return float(var), float(es)
+
+
+class ScenarioResult:
+    def __init__(self, scenarios, underlyings, pnl_by_underlying):
+        self.scenarios = scenarios
+        self.underlyings = underlyings
+        self.by_underlying = pnl_by_underlying
+        self.pnl = pnl_by_underlying.sum(axis=1)
+
+    def var(self, confidence=0.99):
+        return value_at_risk(self.pnl, confidence)
+
+    def worst(self, n=5):
+        # the n largest losses with each underlying's share
+        order = np.argsort(self.pnl)[:n]
+        table = pd.DataFrame(self.by_underlying[order], columns=self.underlyings,
+                             index=[self.scenarios.names[i] for i in order])
+        table.insert(0, 'pnl', self.pnl[order])
+        return table
+
+    def summary(self, confidences=(0.95, 0.99)):
+        rows = {f"{c:.0%}": dict(zip(['VaR', 'ES'], self.var(c))) for c in confidences}
+        return pd.DataFrame(rows).T
+
+
+@timed('compute')
+def revalue_scenarios(engine, scenarios, workers=WORKERS, block_cells=BLOCK_CELLS):
+    '''
+    P&L of every scenario by underlying (S x U), revaluing all legs in blocks of scenarios
+    x legs arrays. Blocks run on a thread pool; numpy and scipy release the GIL in the math.
+    '''
+    underlyings = list(engine.underlyings)
+    spot_moves, vol_shifts = scenarios.align(underlyings)
+    codes = engine.underlying_codes
+    option = engine.option
+    spot0 = engine.base_spot[codes]
+    T = np.maximum(engine.T - scenarios.horizon_days / TRADING_DAYS_PER_YEAR, 0)
+    price0 = np.where(option, blsprice(engine.cp, spot0, engine.strike, engine.T, engine.r, engine.sigma), spot0)
+    # legs x underlyings indicator, P&L by underlying is one matrix product per block
+    owner = np.zeros((len(codes), len(underlyings)))
+    owner[np.arange(len(codes)), codes] = 1.0
+
+    def block(lo, hi):
+        S = spot0 * (1 + spot_moves[lo:hi, codes])
+        v = np.maximum(engine.sigma + vol_shifts[lo:hi, codes], 1e-6)
+        value = np.where(option, blsprice(engine.cp, S, engine.strike, T, engine.r, v), S)
+        return ((value - price0) * engine.quantity) @ owner
+
+    step = max(block_cells // max(len(codes), 1), 1)
+    bounds = [(lo, min(lo + step, len(scenarios))) for lo in range(0, len(scenarios), step)]
+    if workers > 1 and len(bounds) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(lambda b: block(*b), bounds))
+    else:
+        parts = [block(*b) for b in bounds]
+    count('scenario_cells', len(scenarios) * len(codes))
+    pnl = np.vstack(parts) if parts else np.zeros((0, len(underlyings)))
+    return ScenarioResult(scenarios, underlyings, pnl)
+
+
+def book_var(trades, start, end, conn=None, horizon_days=1, tests=STRESS_TESTS, now=None, roots=None):
+    '''
+    Historical-simulation VaR/ES of a trades table plus the stress tests, as
+    (historical ScenarioResult, stress ScenarioResult).
+    '''
+    engine = RiskEngine(book_legs(trades), now=now)
+    history = historical_scenarios(list(engine.underlyings), start, end, conn, engine, horizon_days, roots=roots)
+    return revalue_scenarios(engine, history), revalue_scenarios(engine, stress_scenarios(list(engine.underlyings), tests))
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+# One row per mark of one position. Dates are datetime64[ns] (an int64 epoch underneath) so
+# range filters compare integers, repeated labels are categoricals (one small code per row),
+# the identifying prices stay float64 so they match the typed-in values exactly, as do the marks
+# and P&L (money is not rounded to float32's 7 digits), and only the percent change is float32.
+TRADE_SCHEMA = {
+    'trade_date': 'datetime64[ns]',
+    'symbol': 'category',
+    'strike': 'float64',
+    'expiration': 'datetime64[ns]',
+    'stock_trade_price': 'float64',
+    'effective_delta': 'float64',
+    'delta_source': 'category',
+    'call_trade_price': 'float64',
+    'call_action_type': 'category',
+    'num_call_contracts': 'int32',
+    'put_trade_price': 'float64',
+    'put_action_type': 'category',
+    'num_put_contracts': 'int32',
+    'stock_close_price': 'float64',
+    'call_close_price': 'float64',
+    'put_close_price': 'float64',
+    'daily_pnl': 'float64',
+    'change': 'float32',
+    'resolution': 'category',
+    'hedge_delta': 'float64',
+}
+
+# Rows of option_data as returned by load_marks, the contract names repeat on every row
+MARK_SCHEMA = {
+    'timestamp': 'datetime64[ns]',
+    'call_last': 'float64',
+    'call_bid': 'float64',
+    'call_ask': 'float64',
+    'call_option': 'category',
+    'put_last': 'float64',
+    'put_bid': 'float64',
+    'put_ask': 'float64',
+    'put_option': 'category',
+    'stock': 'float64',
+}
+
+
+def apply_schema(df, schema):
+    '''
+    Cast the columns of `schema` that df has, categoricals are rebuilt so that frames
+    concatenated with different categories end up categorical again.
+    '''
+    for column, dtype in schema.items():
+        if column not in df.columns:
+            continue
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column], format='ISO8601').astype(dtype)
+        elif dtype.startswith('int'):
+            # missing contract counts would otherwise fail the cast
+            df[column] = pd.to_numeric(df[column]).fillna(0).astype(dtype)
+        else:
+            df[column] = df[column].astype(dtype)
+    return df
+
+def empty_trades():
+    return apply_schema(pd.DataFrame({column: pd.Series(dtype='object') for column in TRADE_SCHEMA}), TRADE_SCHEMA)
+
+def as_trades(df):
+    return apply_schema(df.copy(), TRADE_SCHEMA)
+
+def as_marks(df):
+    return apply_schema(df, MARK_SCHEMA)
+
+
+def memory_report(df, sample=None):
+    '''
+    Bytes per column as stored and as the untyped object frame the apps used to build,
+    with a TOTAL row. Object sizes are measured deep (the Python strings and floats included),
+    on the first `sample` rows scaled up to the whole frame when a sample size is given.
+    '''
+    head = df if sample is None or len(df) <= sample else df.iloc[:sample]
+    untyped = head.astype(object)
+    for column in head.columns:
+        if pd.api.types.is_datetime64_any_dtype(head[column]):
+            # the old frame kept dates as the strings they were typed in as
+            untyped[column] = head[column].dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+    typed_bytes = df.memory_usage(index=False, deep=True)
+    object_bytes = (untyped.memory_usage(index=False, deep=True) * (len(df) / max(len(head), 1))).round().astype('int64')
+    report = pd.DataFrame({
+        'dtype': df.dtypes.astype(str),
+        'bytes': typed_bytes,
+        'object_bytes': object_bytes,
+    })
+    report.loc['TOTAL'] = ['', typed_bytes.sum(), object_bytes.sum()]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        report['ratio'] = (report['bytes'] / report['object_bytes'].replace(0, np.nan)).astype(float).round(3)
+    return report
+
+def memory_summary(df, sample=10000):
+    # "1,000 rows: 62.5 KiB typed vs 812.3 KiB as objects (7.7%)"
+    report = memory_report(df, sample)
+    typed, untyped = report.loc['TOTAL', 'bytes'], report.loc['TOTAL', 'object_bytes']
+    share = f" ({typed / untyped:.1%})" if untyped else ''
+    return f"{len(df):,} rows: {typed / 1024:.1f} KiB typed vs {untyped / 1024:.1f} KiB as objects{share}"
@@ -0,0 +1,103 @@
+import threading
+import functools
+
+
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    '''
+    Concurrent calls with the same key share one execution: the first caller runs fn,
+    everyone arriving while it is in flight waits and receives the same result (or exception).
+    Results are shared objects, callers must not modify them in place.
+    '''
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self.lock:
+            self.calls += 1
+            call = self.inflight.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.inflight[key] = Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.inflight[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self.lock:
+            return {'calls': self.calls, 'executions': self.executions, 'coalesced': self.coalesced,
+                    'in_flight': len(self.inflight)}
+
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+def get_flight(name):
+    # one group per upstream (quotes, chains, bars, ...), shared by every window and thread
+    with _groups_lock:
+        if name not in _groups:
+            _groups[name] = SingleFlight(name)
+        return _groups[name]
+
+def coalesced(name):
+    '''
+    Decorator: concurrent calls with equal (hashable) arguments share one execution in group `name`.
+    '''
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return get_flight(name).do(key, fn, *args, **kwargs)
+        return call
+    return wrap
+
+def flight_stats():
+    '''
+    Counters for every group, including the caches sitting in front of them:
+    hits are answered from a cache, coalesced joined a request already in flight.
+    '''
+    with _groups_lock:
+        groups = list(_groups.values())
+    stats = {group.name: group.stats() for group in groups}
+    for name, counters in cache_counters().items():
+        stats.setdefault(name, {}).update(counters)
+    return stats
+
+def cache_counters():
+    from tools.chain_cache import get_chain_cache
+    from tools.quotes import get_quote_service
+    from tools.price_store import get_bar_store
+    chains, quotes, bars = get_chain_cache(), get_quote_service(), get_bar_store()
+    return {
+        'chains': {'hits': chains.hits, 'downloads': chains.downloads},
+        'quotes': {'hits': quotes.hits, 'downloads': quotes.requests},
+        'bars': {'hits': bars.hits, 'downloads': bars.downloads},
+    }
@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+from tools.pnl_db import store_marks, load_marks
+from tools.trading_calendar import get_calendar
+from tools.instrument import timed, count
+
+SIDES = ['buy', 'sell']
+# Marks x combinations evaluated per block, the statistics are accumulated across blocks
+BLOCK_CELLS = 4_000_000
+
+
+def parse_range(text, cast=float):
+    '''
+    "220:240:5" (start:stop:step, stop included), "0,0.2,0.5" or a single value, as a sorted array.
+    Raises ValueError for a step that is not positive or a range with no values.
+    '''
+    text = text.strip()
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        if not step > 0:
+            raise ValueError(f"step must be positive in {text!r}")
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = np.array([float(part) for part in text.split(',') if part.strip()])
+    if not len(values):
+        raise ValueError(f"no values in {text!r}")
+    # arange steps leave 0.30000000000000004 behind
+    return np.unique(np.round(values, 10).astype(cast))
+
+
+def strike_marks(conn, symbol, strikes, expiration, start, end, resolution='1D', fetch=None):
+    '''
+    Marks of the call/put pair at every strike, read from option_data. A pair is fetched with
+    `fetch` (HisPnl.main by default) and stored only when the cache is empty or stops before
+    the last session up to `end` (or the expiration, when earlier), so each contract is loaded once per sweep.
+    '''
+    from realPrice.HisPnl import main as his_main, get_symbol
+    fetch = fetch or his_main
+    # an expired pair has no marks after its expiration, so that is as far as the cache has to reach
+    last_session = pd.Timestamp(get_calendar().previous_session(min(pd.Timestamp(end), pd.Timestamp(expiration))))
+    marks = {}
+    for strike in strikes:
+        call, put = get_symbol(symbol, strike, expiration)
+        stored = load_marks(conn, call, put, start, end, resolution)
+        if stored.empty or stored['timestamp'].iloc[-1].normalize() < last_session:
+            try:
+                fetched = fetch(start, end, symbol, strike, expiration, resolution=resolution)
+            except Exception as e:
+                print(f"Fetching {call}/{put} failed: {e!r}")
+                fetched = None
+            if fetched is not None and not fetched.empty:
+                store_marks(conn, fetched, resolution)
+                stored = load_marks(conn, call, put, start, end, resolution)
+        if stored.empty:
+            print(f"No marks for {call}/{put}, strike {strike} left out of the sweep.")
+            continue
+        marks[float(strike)] = stored
+    return marks
+
+
+def entry_prices(bid, ask, sides):
+    # opening price per side: pay the first ask to buy, receive the first bid to sell
+    first_bid = bid[np.isfinite(bid)][0] if np.isfinite(bid).any() else np.nan
+    first_ask = ask[np.isfinite(ask)][0] if np.isfinite(ask).any() else np.nan
+    return np.array([first_ask if side == 'buy' else first_bid for side in sides])
+
+
+@timed('compute')
+def sweep_pnl(marks_by_strike, stock_trade_price, deltas, call_counts, put_counts, call_sides=SIDES, put_sides=SIDES):
+    '''
+    P&L of every strike x effective delta x call count x put count x call side x put side over
+    the marks, as one broadcast array per strike (marks x combinations) instead of one
+    add_trade per combination. Returns one row per combination ranked by final P&L.
+    '''
+    deltas = np.asarray(deltas, dtype=float)
+    call_counts = np.asarray(call_counts, dtype=float)
+    put_counts = np.asarray(put_counts, dtype=float)
+    call_sign = np.array([1.0 if side == 'buy' else -1.0 for side in call_sides])
+    put_sign = np.array([1.0 if side == 'buy' else -1.0 for side in put_sides])
+    shape = (len(deltas), len(call_counts), len(put_counts), len(call_sides), len(put_sides))
+    if not all(shape):
+        return pd.DataFrame()
+    # axes: marks, delta, call count, put count, call side, put side
+    D = deltas[None, :, None, None, None, None]
+    NC = call_counts[None, None, :, None, None, None]
+    NP = put_counts[None, None, None, :, None, None]
+
+    frames = []
+    for strike, marks in marks_by_strike.items():
+        marks = marks.dropna(subset=['stock'])
+        if marks.empty:
+            continue
+        call_entry = entry_prices(marks['call_bid'].to_numpy(dtype=float), marks['call_ask'].to_numpy(dtype=float), call_sides)
+        put_entry = entry_prices(marks['put_bid'].to_numpy(dtype=float), marks['put_ask'].to_numpy(dtype=float), put_sides)
+        call_last = marks['call_last'].ffill().to_numpy(dtype=float)
+        put_last = marks['put_last'].ffill().to_numpy(dtype=float)
+        stock = marks['stock'].to_numpy(dtype=float) - stock_trade_price
+
+        final = low = high = total = None
+        step = max(BLOCK_CELLS // int(np.prod(shape)), 1)
+        for lo in range(0, len(stock), step):
+            hi = min(lo + step, len(stock))
+            call_move = (call_sign * (call_last[lo:hi, None] - call_entry))[:, None, None, None, :, None]
+            put_move = (put_sign * (put_last[lo:hi, None] - put_entry))[:, None, None, None, None, :]
+            pnl = (np.nan_to_num(NC * call_move) + np.nan_to_num(NP * put_move) + D * stock[lo:hi, None, None, None, None, None]) * 100
+            pnl = np.broadcast_to(pnl, (hi - lo,) + shape)
+            final = pnl[-1]
+            low = pnl.min(axis=0) if low is None else np.minimum(low, pnl.min(axis=0))
+            high = pnl.max(axis=0) if high is None else np.maximum(high, pnl.max(axis=0))
+            total = pnl.sum(axis=0) if total is None else total + pnl.sum(axis=0)
+        count('sweep_cells', len(stock) * int(np.prod(shape)))
+
+        investment = (NC[0] * np.nan_to_num(call_entry)[None, None, None, :, None] +
+                      NP[0] * np.nan_to_num(put_entry)[None, None, None, None, :]) * 100
+        investment = np.broadcast_to(investment, shape)
+        grid = np.meshgrid(deltas, call_counts, put_counts, np.arange(len(call_sides)), np.arange(len(put_sides)), indexing='ij')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.where(investment > 0, final / investment * 100, np.nan)
+        frames.append(pd.DataFrame({
+            'strike': strike,
+            'effective_delta': grid[0].ravel(),
+            'call_action_type': np.asarray(call_sides)[grid[3].ravel()],
+            'num_call_contracts': grid[1].ravel().astype(int),
+            'put_action_type': np.asarray(put_sides)[grid[4].ravel()],
+            'num_put_contracts': grid[2].ravel().astype(int),
+            'call_entry': call_entry[grid[3].ravel()],
+            'put_entry': put_entry[grid[4].ravel()],
+            'final_pnl': final.ravel(),
+            'min_pnl': low.ravel(),
+            'max_pnl': high.ravel(),
+            'mean_pnl': total.ravel() / len(stock),
+            'change': change.ravel(),
+        }))
+    if not frames:
+        return pd.DataFrame()
+    results = pd.concat(frames, ignore_index=True)
+    # the side of a leg with no contracts makes no difference, keep one of them
+    results.loc[results['num_call_contracts'] == 0, ['call_action_type', 'call_entry']] = ['-', np.nan]
+    results.loc[results['num_put_contracts'] == 0, ['put_action_type', 'put_entry']] = ['-', np.nan]
+    keys = ['strike', 'effective_delta', 'call_action_type', 'num_call_contracts', 'put_action_type', 'num_put_contracts']
+    results = results.drop_duplicates(keys)
+    results = results.sort_values('final_pnl', ascending=False, kind='stable').reset_index(drop=True)
+    results[['final_pnl', 'min_pnl', 'max_pnl', 'mean_pnl', 'change']] = results[['final_pnl', 'min_pnl', 'max_pnl', 'mean_pnl', 'change']].round(2)
+    results.index = pd.RangeIndex(1, len(results) + 1, name='rank')
+    return results
+
+
+def heatmap(results, rows='strike', columns='effective_delta', value='final_pnl'):
+    # best value per cell over the other swept dimensions
+    return results.pivot_table(index=rows, columns=columns, values=value, aggfunc='max').sort_index()
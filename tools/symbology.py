@@ -0,0 +1,139 @@
+'''
+Option symbols built from and parsed into (root, expiration, kind, strike), no chain lookup.
+
+    occ      AAPL240920C00195000    root, YYMMDD, C/P, strike x 1000 on 8 digits (Yahoo contractSymbol)
+    polygon  O:AAPL240920C00195000  the OCC symbol behind Polygon's "O:" prefix
+    iqfeed   AAPL2420I195           root, YY, DD, month letter (A-L calls, M-X puts), strike (AAPL2420I192.5)
+
+Single symbols are memoised, so the strings handed out for a contract are the same objects
+every time; the batch versions build or parse each distinct contract of an array once.
+'''
+import re
+from functools import lru_cache
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from tools.trading_calendar import get_calendar
+
+OCC = 'occ'
+POLYGON = 'polygon'
+IQFEED = 'iqfeed'
+# Contracts kept per memoised builder/parser
+CACHE_SIZE = 65536
+
+OptionSymbol = namedtuple('OptionSymbol', ['root', 'expiration', 'kind', 'strike'])
+
+# Yahoo index tickers and the OCC roots of their (monthly, weekly) series
+INDEX_ROOTS = {'^SPX': ('SPX', 'SPXW'), '^NDX': ('NDX', 'NDXP'), '^RUT': ('RUT', 'RUTW'),
+               '^VIX': ('VIX', 'VIXW'), '^XSP': ('XSP', 'XSP')}
+
+# roots may carry digits (adjusted contracts), the fixed-width tail decides where they end
+OCC_SYMBOL = re.compile(r'^(.+?)(\d{2})(\d{2})(\d{2})([CP])(\d{8})$')
+IQFEED_SYMBOL = re.compile(r'^(.+?)(\d{2})(\d{2})([A-X])(\d+(?:\.\d+)?)$')
+
+
+def iqfeed_strike(strike):
+    # 195 -> "195", 192.5 -> "192.5"
+    return f"{float(strike):.3f}".rstrip('0').rstrip('.')
+
+
+def is_monthly(expiration):
+    # the third Friday of its month, or the Thursday before when that Friday is an exchange holiday
+    day = pd.Timestamp(expiration)
+    if day.weekday() == 4:
+        return 15 <= day.day <= 21
+    return day.weekday() == 3 and 14 <= day.day <= 20 and get_calendar(day).is_holiday(day + pd.Timedelta(days=1))
+
+
+def listed_root(ticker, expiration):
+    '''
+    OCC root of the options on a Yahoo ticker: ^SPX is SPX on the monthly expiry and SPXW on
+    the others, class shares drop the separator (BRK-B is BRKB).
+    '''
+    if ticker in INDEX_ROOTS:
+        monthly, weekly = INDEX_ROOTS[ticker]
+        return monthly if is_monthly(expiration) else weekly
+    return ticker.lstrip('^').replace('-', '').replace('.', '')
+
+
+def underlying_ticker(root):
+    # the Yahoo ticker whose chain lists a root, ^SPX for SPXW
+    for ticker, roots in INDEX_ROOTS.items():
+        if root in roots:
+            return ticker
+    return root
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def build_symbol(root, expiration, strike, kind, style=OCC):
+    '''
+    Symbol of one contract, kind is 'C'/'P' (or 'call'/'put'). IQFeed strikes are written
+    without trailing zeros, so whole strikes keep the names HisPnl has always stored.
+    '''
+    expiration = pd.Timestamp(expiration)
+    kind = kind[0].upper()
+    if style == IQFEED:
+        letter = chr(ord('A' if kind == 'C' else 'M') + expiration.month - 1)
+        return f"{root}{expiration:%y}{expiration:%d}{letter}{iqfeed_strike(strike)}"
+    occ = f"{root}{expiration:%y%m%d}{kind}{round(float(strike) * 1000):08d}"
+    return f"O:{occ}" if style == POLYGON else occ
+
+
+def option_pair(root, expiration, strike, style=OCC):
+    # (call, put) on one strike
+    return build_symbol(root, expiration, strike, 'C', style), build_symbol(root, expiration, strike, 'P', style)
+
+
+def build_symbols(roots, expirations, strikes, kinds, style=OCC):
+    '''
+    Symbols for arrays of roots, expirations, strikes and kinds broadcast together.
+    '''
+    roots, expirations, strikes, kinds = np.broadcast_arrays(
+        np.asarray(roots, dtype=object), np.asarray(expirations, dtype=object),
+        np.asarray(strikes, dtype=float), np.asarray(kinds, dtype=object))
+    terms = pd.MultiIndex.from_arrays([roots.ravel(), pd.to_datetime(expirations.ravel()), strikes.ravel(), kinds.ravel()])
+    codes, contracts = terms.factorize()
+    built = np.array([build_symbol(root, expiration, strike, kind, style) for root, expiration, strike, kind in contracts],
+                     dtype=object)
+    return built[codes].reshape(roots.shape)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_symbol(symbol):
+    '''
+    OptionSymbol(root, expiration, kind, strike) of an OCC, Polygon or IQFeed symbol,
+    None when it is none of them.
+    '''
+    if not isinstance(symbol, str):
+        return None
+    polygon = symbol.startswith('O:')
+    text = symbol[2:] if polygon else symbol
+    match = OCC_SYMBOL.match(text)
+    if match:
+        root, year, month, day, kind, strike = match.groups()
+        month, strike = int(month), int(strike) / 1000
+    else:
+        match = None if polygon else IQFEED_SYMBOL.match(text)
+        if not match:
+            return None
+        root, year, day, letter, strike = match.groups()
+        kind = 'C' if letter < 'M' else 'P'
+        month, strike = (ord(letter) - ord('A')) % 12 + 1, float(strike)
+    try:
+        expiration = pd.Timestamp(2000 + int(year), month, int(day))
+    except ValueError:
+        return None
+    return OptionSymbol(root, expiration, kind, strike)
+
+
+def parse_symbols(symbols):
+    '''
+    One row (root, expiration, kind, strike) per symbol, NaN/NaT for the ones that do not parse.
+    '''
+    codes, unique = pd.factorize(np.asarray(symbols, dtype=object), use_na_sentinel=False)
+    missing = OptionSymbol(None, pd.NaT, None, np.nan)
+    parsed = pd.DataFrame([parse_symbol(symbol) or missing for symbol in unique], columns=OptionSymbol._fields)
+    parsed['expiration'] = pd.to_datetime(parsed['expiration'])
+    return parsed.take(codes).reset_index(drop=True)
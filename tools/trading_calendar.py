@@ -0,0 +1,151 @@
+import threading
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+import pytz
+
+EASTERN = pytz.timezone('US/Eastern')
+OPEN_MINUTE = 9 * 60 + 30
+CLOSE_MINUTE = 16 * 60
+EARLY_CLOSE_MINUTE = 13 * 60
+SESSION_MINUTES = CLOSE_MINUTE - OPEN_MINUTE
+TRADING_DAYS_PER_YEAR = 252
+
+
+def to_days(values):
+    # anything date-like (scalar or array) as datetime64[D]
+    if isinstance(values, (str, date, datetime, pd.Timestamp, np.datetime64)):
+        return np.datetime64(pd.Timestamp(values).strftime('%Y-%m-%d'), 'D')
+    return pd.to_datetime(pd.Index(values)).normalize().values.astype('datetime64[D]')
+
+
+class TradingCalendar:
+    '''
+    NYSE sessions, holidays and early closes for [first_year, last_year] as sorted datetime64[D] arrays.
+    Day lookups are binary searches, ranges are slices, and cumulative session minutes
+    give the open-market time between any two moments without walking the days.
+    '''
+    def __init__(self, first_year, last_year):
+        import holidays
+        self.first_year = first_year
+        self.last_year = last_year
+        years = range(first_year, last_year + 1)
+        nyse = holidays.NYSE(years=years)
+        self.holidays = np.array(sorted(nyse), dtype='datetime64[D]')
+        self.busdaycal = np.busdaycalendar(holidays=self.holidays)
+
+        days = np.arange(np.datetime64(f'{first_year}-01-01'), np.datetime64(f'{last_year + 1}-01-01'))
+        self.sessions = days[np.is_busday(days, busdaycal=self.busdaycal)]
+
+        # the exchange closes at 13:00 on July 3rd, the day after Thanksgiving and Christmas Eve when they are sessions
+        thanksgiving = [day for day, name in nyse.items() if 'Thanksgiving' in name]
+        candidates = [np.datetime64(f'{year}-07-03') for year in years] + \
+                     [np.datetime64(f'{year}-12-24') for year in years] + \
+                     [np.datetime64(day, 'D') + 1 for day in thanksgiving]
+        candidates = np.array(sorted(candidates), dtype='datetime64[D]')
+        self.early_closes = candidates[self.is_session(candidates)]
+
+        close = np.full(len(self.sessions), CLOSE_MINUTE)
+        close[np.isin(self.sessions, self.early_closes)] = EARLY_CLOSE_MINUTE
+        self.close_minutes = close
+        # cumulative_minutes[i] is the trading time before session i opens
+        self.cumulative_minutes = np.concatenate([[0], np.cumsum(close - OPEN_MINUTE)])
+
+    def covers(self, days):
+        days = np.atleast_1d(days)
+        return days.min() >= np.datetime64(f'{self.first_year}-01-01') and days.max() < np.datetime64(f'{self.last_year + 1}-01-01')
+
+    def is_session(self, days):
+        days = to_days(days)
+        idx = np.searchsorted(self.sessions, days)
+        found = np.asarray(idx < len(self.sessions)) & (self.sessions[np.minimum(idx, len(self.sessions) - 1)] == days)
+        return bool(found) if np.ndim(days) == 0 else found
+
+    def is_holiday(self, day):
+        day = to_days(day)
+        idx = np.searchsorted(self.holidays, day)
+        return bool(idx < len(self.holidays) and self.holidays[idx] == day)
+
+    def sessions_in_range(self, start, end):
+        # sessions with start <= day <= end
+        lo = np.searchsorted(self.sessions, to_days(start), side='left')
+        hi = np.searchsorted(self.sessions, to_days(end), side='right')
+        return self.sessions[lo:hi]
+
+    def session_count(self, start, end):
+        # vectorised over arrays of start/end days, end inclusive
+        return np.busday_count(to_days(start), to_days(end) + 1, busdaycal=self.busdaycal)
+
+    def next_session(self, day):
+        # first session on or after day
+        return self.sessions[np.searchsorted(self.sessions, to_days(day), side='left')]
+
+    def previous_session(self, day):
+        # last session on or before day
+        return self.sessions[np.searchsorted(self.sessions, to_days(day), side='right') - 1]
+
+    def close_minute(self, day):
+        idx = np.searchsorted(self.sessions, to_days(day))
+        return int(self.close_minutes[idx])
+
+    def is_open(self, now=None):
+        now = now or datetime.now(EASTERN)
+        if not self.is_session(now.date()):
+            return False
+        minute = now.hour * 60 + now.minute
+        return OPEN_MINUTE <= minute <= self.close_minute(now.date())
+
+    def elapsed_minutes(self, moments):
+        '''
+        Trading minutes from the calendar start to each moment (naive Eastern timestamps), vectorised.
+        '''
+        moments = pd.to_datetime(pd.Index(np.atleast_1d(moments)))
+        days = moments.normalize().values.astype('datetime64[D]')
+        minute = (moments.hour * 60 + moments.minute + moments.second / 60.0).to_numpy()
+        idx = np.searchsorted(self.sessions, days, side='left')
+        is_session = (idx < len(self.sessions)) & (self.sessions[np.minimum(idx, len(self.sessions) - 1)] == days)
+        close = self.close_minutes[np.minimum(idx, len(self.sessions) - 1)]
+        inside = np.clip(minute, OPEN_MINUTE, close) - OPEN_MINUTE
+        return self.cumulative_minutes[idx] + np.where(is_session, inside, 0)
+
+    def year_fraction(self, expiry, now=None):
+        '''
+        Open-market time from now until the close of each expiry, in years of 252 full sessions.
+        Early closes count for the hours actually traded.
+        '''
+        now = now or datetime.now(EASTERN).replace(tzinfo=None)
+        expiry = to_days(expiry)
+        expiry_close = pd.to_datetime(np.atleast_1d(expiry)) + pd.Timedelta(hours=23, minutes=59)
+        remaining = self.elapsed_minutes(expiry_close) - self.elapsed_minutes(now)[0]
+        years = np.maximum(remaining, 0) / (TRADING_DAYS_PER_YEAR * SESSION_MINUTES)
+        return float(years[0]) if np.ndim(expiry) == 0 else years
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+def get_calendar(*days):
+    '''
+    The shared calendar, rebuilt with a wider span if any of `days` falls outside it.
+    '''
+    global _calendar
+    with _calendar_lock:
+        this_year = date.today().year
+        if _calendar is None:
+            _calendar = TradingCalendar(2000, this_year + 10)
+        if days and not _calendar.covers(to_days(list(days))):
+            years = pd.to_datetime(list(days)).year
+            _calendar = TradingCalendar(min(2000, years.min()), max(this_year + 10, years.max()))
+    return _calendar
+
+def market_open(now=None):
+    return get_calendar().is_open(now)
+
+def session_date():
+    # the date the market is on, a UTC evening is still the same US session
+    return datetime.now(EASTERN).strftime('%Y-%m-%d')
+
+def last_closed_session():
+    # the latest session that closed before today's (US/Eastern) date, as datetime64[D]
+    today = to_days(session_date())
+    return get_calendar().previous_session(today - 1)
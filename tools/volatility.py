@@ -0,0 +1,250 @@
+'''
+Realized against implied volatility.
+
+Rolling realized vol of an underlying's daily bars (close-to-close, Parkinson and
+Garman-Klass), lined up with the implied vol of a position's stored marks, the vol premium
+(implied minus realized) and per-regime statistics. Realized vols are cached per symbol and
+window in <root>/<symbol>_<window>.npz and only the sessions after the cached ones are computed.
+
+    python -m tools.volatility AAPL --strike 195 --expiration 2024-09-20 \\
+        --start 2024-01-02 --end 2024-09-20 --windows 10 21 63
+'''
+import os
+import sqlite3
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tools.trading_calendar import TRADING_DAYS_PER_YEAR, get_calendar, last_closed_session
+from tools.instrument import timed, count
+
+STORE_DIR = os.environ.get('PNL_VOL_STORE', os.path.join('cache', 'vol'))
+DB_PATH = os.environ.get('PNL_DB', 'option_data.db')
+# Rolling windows in sessions: two weeks, a month and a quarter
+WINDOWS = [10, 21, 63]
+ESTIMATORS = ['close_to_close', 'parkinson', 'garman_klass']
+
+
+def to_day(value):
+    return np.datetime64(pd.Timestamp(value).strftime('%Y-%m-%d'), 'D')
+
+
+def realized_vol(bars, window):
+    '''
+    Annualised rolling vol of a Date/Open/High/Low/Close frame for each estimator, NaN until
+    `window` sessions (window returns for close-to-close) are available.
+    '''
+    close = bars['Close'].astype(float)
+    log_hl = np.log(bars['High'].astype(float) / bars['Low'].astype(float))
+    log_co = np.log(close / bars['Open'].astype(float))
+    returns = np.log(close / close.shift(1))
+    variance = {
+        'close_to_close': returns.rolling(window, min_periods=window).var(),
+        'parkinson': (log_hl ** 2 / (4 * np.log(2))).rolling(window, min_periods=window).mean(),
+        'garman_klass': (0.5 * log_hl ** 2 - (2 * np.log(2) - 1) * log_co ** 2).rolling(window, min_periods=window).mean(),
+    }
+    out = {'date': pd.to_datetime(bars['Date']).dt.normalize().values.astype('datetime64[D]')}
+    for name in ESTIMATORS:
+        out[name] = np.sqrt(np.maximum(variance[name].to_numpy(), 0) * TRADING_DAYS_PER_YEAR)
+    return out
+
+
+class VolStore:
+    '''
+    Rolling realized vols per symbol and window kept as arrays in <root>/<symbol>_<window>.npz.
+    Closed sessions are computed once: an update reads the bars of the new sessions plus one
+    window before them from the feed provider and appends the result.
+    '''
+    def __init__(self, root=STORE_DIR, provider=None):
+        self.root = root
+        self.provider = provider
+        self.series = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.computed = 0
+
+    def path(self, symbol, window):
+        return os.path.join(self.root, f"{symbol.replace('^', '_')}_{window}.npz")
+
+    def load(self, symbol, window):
+        key = (symbol, window)
+        if key not in self.series:
+            path = self.path(symbol, window)
+            if os.path.exists(path):
+                with np.load(path) as data:
+                    self.series[key] = {k: data[k] for k in data.files}
+            else:
+                self.series[key] = None
+        return self.series[key]
+
+    def save(self, symbol, window, series):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path(symbol, window) + '.tmp.npz'
+        np.savez(tmp, **series)
+        os.replace(tmp, self.path(symbol, window))
+        self.series[(symbol, window)] = series
+
+    def compute(self, symbol, window, start, end):
+        # estimators for the sessions in [start, end], the bars reach back one window before start
+        from realPrice.feed import get_provider
+        provider = self.provider or get_provider()
+        lookback = start - np.timedelta64(2 * window + 10, 'D')
+        bars = provider.get_bars(symbol, pd.Timestamp(lookback), pd.Timestamp(end + 1))
+        if bars is None or bars.empty:
+            return {'date': np.array([], dtype='datetime64[D]'), **{name: np.array([], dtype=float) for name in ESTIMATORS}}
+        series = realized_vol(bars, window)
+        keep = (series['date'] >= start) & (series['date'] <= end)
+        self.computed += int(keep.sum())
+        count('vol_sessions_computed', int(keep.sum()))
+        return {k: v[keep] for k, v in series.items()}
+
+    def update(self, symbol, window, start, end):
+        '''
+        Make sure closed sessions in [start, end] are computed, only those after the cache's
+        last checked day (or before its first one) are. The checked day only moves up to the
+        last session the feed returned bars for, so a failed or empty download is asked again.
+        '''
+        last_closed = min(get_calendar().previous_session(end), last_closed_session())
+        series = self.load(symbol, window)
+        pieces = []
+        if series is None:
+            since, checked = start, start - 1
+        else:
+            since, checked = series['since'][()], series['checked'][()]
+            if start < since:
+                pieces.append(self.compute(symbol, window, start, since - 1))
+            pieces.append({k: series[k] for k in ['date'] + ESTIMATORS})
+            since = min(since, start)
+        if checked < last_closed:
+            fresh = self.compute(symbol, window, checked + 1, last_closed)
+            pieces.append(fresh)
+            if len(fresh['date']):
+                checked = max(checked, fresh['date'].max())
+
+        if series is not None and len(pieces) == 1:
+            self.hits += 1
+            return series
+        merged = {k: np.concatenate([p[k] for p in pieces]) if pieces else np.array([], dtype=float)
+                  for k in ['date'] + ESTIMATORS}
+        days, first = np.unique(merged['date'].astype('datetime64[D]'), return_index=True)
+        merged = {k: merged[k][first] for k in ESTIMATORS}
+        merged['date'] = days
+        merged['since'] = np.array(since)
+        merged['checked'] = np.array(checked)
+        self.save(symbol, window, merged)
+        return merged
+
+    def read(self, symbol, window, start, end):
+        '''
+        Realized vols of the closed sessions with start <= date <= end, one column per estimator.
+        '''
+        start, end = to_day(start), to_day(end)
+        with self.lock:
+            series = self.update(symbol, window, start, end)
+        lo = np.searchsorted(series['date'], start, side='left')
+        hi = np.searchsorted(series['date'], end, side='right')
+        return pd.DataFrame({name: series[name][lo:hi] for name in ESTIMATORS},
+                            index=pd.DatetimeIndex(series['date'][lo:hi], name='date'))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_vol_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VolStore()
+    return _store
+
+
+def implied_series(conn, symbol, strike, expiration, start, end):
+    '''
+    Daily implied vol of a call/put pair from its stored 1D marks: the mean of the call and put
+    mid vols, either one when the other has no quote. Unsolved rows are solved first.
+    '''
+    from realPrice.HisPnl import get_symbol
+    from tools.implied_vol import backfill_iv, load_iv
+    backfill_iv(conn)
+    call, put = get_symbol(symbol, strike, expiration)
+    marks = load_iv(conn, call, put, start, end, '1D')
+    if marks.empty:
+        return pd.Series(dtype=float, name='implied')
+    implied = marks[['call_iv_mid', 'put_iv_mid']].mean(axis=1)
+    return pd.Series(implied.to_numpy(), index=pd.DatetimeIndex(marks['timestamp'].dt.normalize(), name='date'),
+                     name='implied')
+
+
+@timed('compute')
+def vol_premium(symbol, strike, expiration, start, end, conn=None, windows=WINDOWS, root=None, store=None):
+    '''
+    One row per session: the position's implied vol, realized vol per estimator and window
+    (`close_to_close_21`, ...) and the premium of implied over close-to-close realized vol
+    (`premium_21`, ...). `root` is the option root when it differs from the underlying (SPXW).
+    '''
+    store = store or get_vol_store()
+    frames = []
+    for window in windows:
+        realized = store.read(symbol, window, start, end)
+        frames.append(realized.add_suffix(f'_{window}'))
+    table = pd.concat(frames, axis=1) if frames else pd.DataFrame()
+    if conn is not None:
+        implied = implied_series(conn, root or symbol, strike, expiration, start, end)
+        table = table.join(implied.groupby(level=0).last(), how='outer')
+    else:
+        table['implied'] = np.nan
+    for window in windows:
+        table[f'premium_{window}'] = table['implied'] - table[f'close_to_close_{window}']
+    return table.sort_index()
+
+
+def regime_stats(table, window, labels=('low', 'normal', 'high')):
+    '''
+    Sessions split into equal-count regimes of close-to-close realized vol over `window`, with
+    per regime the sessions, the realized vol range, mean implied vol, mean premium, share of
+    sessions where implied was above realized, and the realized vol one window later.
+    '''
+    realized = table[f'close_to_close_{window}']
+    premium = table[f'premium_{window}']
+    valid = realized.notna()
+    if valid.sum() < len(labels):
+        return pd.DataFrame()
+    regime = pd.qcut(realized[valid].rank(method='first'), len(labels), labels=list(labels))
+    frame = pd.DataFrame({'regime': regime, 'realized': realized[valid], 'implied': table['implied'][valid],
+                          'premium': premium[valid], 'rich': (premium[valid] > 0).where(premium[valid].notna()),
+                          'realized_next': realized.shift(-window)[valid]})
+    return frame.groupby('regime', observed=False).agg(
+        sessions=('realized', 'size'), realized_min=('realized', 'min'), realized_max=('realized', 'max'),
+        realized_mean=('realized', 'mean'), implied_mean=('implied', 'mean'), premium_mean=('premium', 'mean'),
+        implied_above=('rich', 'mean'), realized_next=('realized_next', 'mean')).round(4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('symbol')
+    parser.add_argument('--strike', type=float, required=True)
+    parser.add_argument('--expiration', required=True)
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--windows', type=int, nargs='+', default=WINDOWS)
+    parser.add_argument('--root', help='option root when it is not the symbol')
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--out', help='write the daily table as CSV')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    table = vol_premium(args.symbol, args.strike, args.expiration, args.start, args.end, conn, args.windows, args.root)
+    conn.close()
+    if args.out:
+        table.to_csv(args.out)
+    with pd.option_context('display.width', 200, 'display.max_columns', 30):
+        print(table.tail(10).round(4).to_string())
+        for window in args.windows:
+            print(f"\nRegimes by {window}-session realized vol")
+            print(regime_stats(table, window).to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from PyQt5.QtCore import QObject, QTimer
+
+from tools.instrument import get_metrics, count
+
+# Heartbeat period of the GUI thread and how late it may be before it counts as a stall (ms)
+HEARTBEAT_MS = int(os.environ.get('PNL_HEARTBEAT_MS', '50'))
+STALL_MS = int(os.environ.get('PNL_STALL_MS', '250'))
+# PNL_WATCHDOG=0 turns the watchdog off
+ENABLED = os.environ.get('PNL_WATCHDOG', '1') != '0'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKIP = {os.path.abspath(__file__), os.path.join(ROOT, 'tools', 'instrument.py'), os.path.join(ROOT, 'tools', 'single_flight.py')}
+
+
+def frame_label(frame):
+    return f"{frame.f_code.co_name} ({os.path.relpath(frame.f_code.co_filename, ROOT)}:{frame.f_lineno})"
+
+def snapshot(frame):
+    '''
+    The stack as (labels outermost first, path through this repo's code only).
+    '''
+    stack, own = [], []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if filename.startswith(ROOT + os.sep) and filename not in SKIP:
+            own.append(f"{frame.f_code.co_name} ({os.path.relpath(filename, ROOT)})")
+        frame = frame.f_back
+    return tuple(reversed(stack)), ' > '.join(reversed(own)) or '<outside app code>'
+
+
+class StallWatchdog(QObject):
+    '''
+    A GUI-thread QTimer beats every HEARTBEAT_MS; a background thread notices when the beat
+    is more than STALL_MS late and samples the GUI thread's stack until it beats again.
+    Each stall is attributed to the app code path seen most often while it lasted and
+    logged through tools.instrument (event 'stall', per-path totals in the metrics file).
+    '''
+    def __init__(self, parent=None, heartbeat_ms=HEARTBEAT_MS, stall_ms=STALL_MS):
+        super().__init__(parent)
+        self.heartbeat = heartbeat_ms / 1000.0
+        self.threshold = stall_ms / 1000.0
+        self.gui_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.max_latency = 0.0
+        self.late_beats = 0
+        self.stalls = []
+        self.by_path = Counter()
+        self.stopped = threading.Event()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.beat)
+        self.monitor = threading.Thread(target=self.watch, name='pnl-watchdog', daemon=True)
+
+    def start(self):
+        self.last_beat = time.monotonic()
+        self.timer.start(int(self.heartbeat * 1000))
+        self.monitor.start()
+        return self
+
+    def stop(self):
+        self.timer.stop()
+        self.stopped.set()
+
+    def beat(self):
+        now = time.monotonic()
+        # event loop latency: how much later than scheduled this beat ran
+        latency = max(now - self.last_beat - self.heartbeat, 0.0)
+        self.max_latency = max(self.max_latency, latency)
+        if latency > self.heartbeat:
+            self.late_beats += 1
+        self.last_beat = now
+
+    def watch(self):
+        poll = min(self.heartbeat, self.threshold / 4)
+        while not self.stopped.wait(poll):
+            beat = self.last_beat
+            if time.monotonic() - beat < self.threshold + self.heartbeat:
+                continue
+            samples = Counter()
+            stacks = {}
+            actions = set()
+            # sample until the GUI thread beats again
+            while self.last_beat == beat and not self.stopped.is_set():
+                frame = sys._current_frames().get(self.gui_thread)
+                if frame is not None:
+                    stack, path = snapshot(frame)
+                    samples[path] += 1
+                    stacks.setdefault(path, stack)
+                actions.update(a.name for a in get_metrics().actions)
+                del frame
+                time.sleep(poll)
+            if samples:
+                self.record(time.monotonic() - beat - self.heartbeat, samples, stacks, sorted(actions))
+
+    def record(self, seconds, samples, stacks, actions):
+        path, hits = samples.most_common(1)[0]
+        stall = {'event': 'stall', 'seconds': round(seconds, 3), 'code_path': path,
+                 'share': round(hits / sum(samples.values()), 2), 'stack': list(stacks[path]),
+                 'actions': actions}
+        self.stalls.append(stall)
+        self.by_path[path] += seconds
+        metrics = get_metrics()
+        with metrics.lock:
+            metrics.stages[f"stall: {path}"].add(seconds)
+        count('ui_stalls')
+        metrics.log(stall)
+        print(f"UI stalled {seconds:.2f}s in {path}")
+
+    def worst(self, n=5):
+        # code paths ranked by total time they froze the UI
+        return self.by_path.most_common(n)
+
+
+def install_watchdog(window):
+    '''
+    Start a watchdog owned by `window` unless PNL_WATCHDOG=0.
+    '''
+    if not ENABLED:
+        return None
+    return StallWatchdog(window).start()